@@ -4,10 +4,81 @@ Email Search Range Configuration Tool
 This script helps you configure the email search range settings
 """
 
+import json
 import os
-import re
+import shutil
+import sys
+import tempfile
 from email_config import EMAIL_SETTINGS
 
+# Comment lines delimiting the EMAIL_SETTINGS block in email_config.py
+SETTINGS_BEGIN = "# <<<EMAIL_SETTINGS>>>"
+SETTINGS_END = "# <<<END>>>"
+
+# (path, st_mtime_ns, st_size, content) of the last email_config.py read or written
+_config_cache = None
+
+# Settings written back as references to the variables loaded from credentials.env
+CREDENTIAL_FIELDS = ("email_address", "password", "folder_name")
+
+# Comment written after each setting, as in the shipped email_config.py
+SETTING_COMMENTS = {
+    "email_address": "Replace with your email",
+    "password": "Will prompt for password if None",
+    "folder_name": "Email folder to search",
+    "download_path": "Path to save attachments",
+    "file_types": "File types to download",
+    "enabled": "Set to True to use search range",
+    "type": 'Options: "all", "date_range", "count_limit", "recent_days"',
+    "start_date": "Format: YYYYMMDD",
+    "end_date": "Format: YYYYMMDD",
+    "count_limit": "Maximum number of emails to process",
+    "recent_days": "Process emails from last N days",
+    "batch_size": "Number of emails to process in each batch",
+}
+
+class _Identifier:
+    """Placeholder that is written out as a bare variable name"""
+    def __init__(self, name):
+        self.name = name
+    
+    def __repr__(self):
+        return self.name
+
+def _format_dict(settings, indent=0):
+    """Render a settings dict one key per line, with double-quoted keys and strings"""
+    pad = " " * (indent + 4)
+    lines = ["{"]
+    for i, (key, value) in enumerate(settings.items(), 1):
+        comma = "," if i < len(settings) else ""
+        if isinstance(value, dict):
+            lines.append(f"{pad}{json.dumps(key)}: {_format_dict(value, indent + 4)}{comma}")
+            continue
+        # JSON string escapes are valid Python ones
+        text = json.dumps(value, ensure_ascii=False) if isinstance(value, str) else repr(value)
+        line = f"{pad}{json.dumps(key)}: {text}{comma}"
+        comment = SETTING_COMMENTS.get(key)
+        lines.append(f"{line}  # {comment}" if comment else line)
+    lines.append(" " * indent + "}")
+    return "\n".join(lines)
+
+def format_assignment(name, settings):
+    """Render a top-level dict assignment for email_config.py, e.g. GMAIL_CONFIG = {...}"""
+    return f"{name} = {_format_dict(settings)}"
+
+def format_email_settings(settings, references=CREDENTIAL_FIELDS):
+    """
+    Render settings as the EMAIL_SETTINGS assignment for email_config.py, in the layout main.py also writes
+    
+    Args:
+        settings (dict): Settings to write
+        references (tuple): Fields written as the variable of the same name instead of their value
+    """
+    settings = dict(settings)
+    for field in references:
+        settings[field] = _Identifier(field)
+    return format_assignment("EMAIL_SETTINGS", settings)
+
 def display_current_config():
     """Display current search range configuration"""
     print("=== Current Email Search Range Configuration ===")
@@ -27,8 +98,33 @@ def display_current_config():
     
     print()
 
+def _ask(prompt, answers=None):
+    """Return the next pre-read answer if any are left, otherwise prompt for one"""
+    if answers:
+        return answers.pop(0)
+    try:
+        return input(prompt).strip()
+    except EOFError:
+        # Piped input that ran out of lines
+        return ""
+
+def _yes(prompt):
+    """Ask a yes/no question; any answer starting with y or Y counts as yes"""
+    return _ask(prompt)[:1].lower() == 'y'
+
+def _read_int(prompt, answers=None, default=None):
+    """Read a whole number; blank input gives default, anything non-numeric gives None"""
+    value = _ask(prompt, answers)
+    if not value:
+        return default
+    return int(value) if value.isdecimal() else None
+
 def configure_search_range():
     """Interactive configuration of search range"""
+    # When stdin is piped, all answers may come on one line, e.g. "2 20240101 20241231 100";
+    # any not given there are read one per line, as when typed
+    answers = None if sys.stdin.isatty() else sys.stdin.readline().split()
+    
     print("=== Email Search Range Configuration ===")
     print("Choose your search range option:")
     print("1. All emails (default)")
@@ -37,72 +133,106 @@ def configure_search_range():
     print("4. Recent days (last N days)")
     print("5. Disable search range (use all emails)")
     
-    choice = input("\nEnter your choice (1-5): ").strip()
+    choice = _ask("\nEnter your choice (1-5): ", answers)
+    search_range = EMAIL_SETTINGS["search_range"]
+    date_range = search_range["date_range"]
     
     if choice == "1":
         # All emails
-        EMAIL_SETTINGS["search_range"]["enabled"] = False
-        EMAIL_SETTINGS["search_range"]["type"] = "all"
+        search_range["enabled"] = False
+        search_range["type"] = "all"
         print("✓ Configured to download all emails")
         
     elif choice == "2":
         # Date range
-        EMAIL_SETTINGS["search_range"]["enabled"] = True
-        EMAIL_SETTINGS["search_range"]["type"] = "date_range"
+        search_range["enabled"] = True
+        search_range["type"] = "date_range"
         
         print("\nEnter date range (format: YYYYMMDD)")
-        start_date = input("Start date (e.g., 20240101): ").strip()
-        end_date = input("End date (e.g., 20241231): ").strip()
+        start_date = _ask("Start date (e.g., 20240101): ", answers)
+        end_date = _ask("End date (e.g., 20241231): ", answers)
         
-        EMAIL_SETTINGS["search_range"]["date_range"]["start_date"] = start_date
-        EMAIL_SETTINGS["search_range"]["date_range"]["end_date"] = end_date
+        date_range["start_date"] = start_date
+        date_range["end_date"] = end_date
         
         print(f"✓ Configured date range: {start_date} to {end_date}")
         
     elif choice == "3":
         # Count limit
-        EMAIL_SETTINGS["search_range"]["enabled"] = True
-        EMAIL_SETTINGS["search_range"]["type"] = "count_limit"
+        search_range["enabled"] = True
+        search_range["type"] = "count_limit"
         
-        try:
-            count_limit = int(input("Enter maximum number of emails to process: ").strip())
-            EMAIL_SETTINGS["search_range"]["count_limit"] = count_limit
-            print(f"✓ Configured to process maximum {count_limit} emails")
-        except ValueError:
+        count_limit = _read_int("Enter maximum number of emails to process: ", answers)
+        if count_limit is None:
             print("Invalid number. Using default of 100 emails.")
-            EMAIL_SETTINGS["search_range"]["count_limit"] = 100
+            search_range["count_limit"] = 100
+        else:
+            search_range["count_limit"] = count_limit
+            print(f"✓ Configured to process maximum {count_limit} emails")
             
     elif choice == "4":
         # Recent days
-        EMAIL_SETTINGS["search_range"]["enabled"] = True
-        EMAIL_SETTINGS["search_range"]["type"] = "recent_days"
+        search_range["enabled"] = True
+        search_range["type"] = "recent_days"
         
-        try:
-            recent_days = int(input("Enter number of recent days to search: ").strip())
-            EMAIL_SETTINGS["search_range"]["recent_days"] = recent_days
-            print(f"✓ Configured to search last {recent_days} days")
-        except ValueError:
+        recent_days = _read_int("Enter number of recent days to search: ", answers)
+        if recent_days is None:
             print("Invalid number. Using default of 30 days.")
-            EMAIL_SETTINGS["search_range"]["recent_days"] = 30
+            search_range["recent_days"] = 30
+        else:
+            search_range["recent_days"] = recent_days
+            print(f"✓ Configured to search last {recent_days} days")
             
     elif choice == "5":
         # Disable search range
-        EMAIL_SETTINGS["search_range"]["enabled"] = False
+        search_range["enabled"] = False
         print("✓ Disabled search range - will download all emails")
         
     else:
         print("Invalid choice. Using default (all emails).")
-        EMAIL_SETTINGS["search_range"]["enabled"] = False
-        EMAIL_SETTINGS["search_range"]["type"] = "all"
+        search_range["enabled"] = False
+        search_range["type"] = "all"
     
     # Configure batch size
-    try:
-        batch_size = int(input("\nEnter batch size for processing (default 50): ").strip() or "50")
-        EMAIL_SETTINGS["search_range"]["batch_size"] = batch_size
-        print(f"✓ Batch size set to {batch_size}")
-    except ValueError:
+    batch_size = _read_int("\nEnter batch size for processing (default 50): ", answers, default=50)
+    if batch_size is None:
         print("Invalid batch size. Using default of 50.")
-        EMAIL_SETTINGS["search_range"]["batch_size"] = 50
+        search_range["batch_size"] = 50
+    else:
+        search_range["batch_size"] = batch_size
+        print(f"✓ Batch size set to {batch_size}")
+
+def _read_config(config_file):
+    """Read the config file, reusing the cached text if it has not changed on disk"""
+    global _config_cache
+    stat = os.stat(config_file)
+    key = (config_file, stat.st_mtime_ns, stat.st_size)
+    if _config_cache is not None and _config_cache[:3] == key:
+        return _config_cache[3]
+    
+    with open(config_file, 'r', encoding='utf-8') as f:
+        content = f.read()
+    _config_cache = key + (content,)
+    return content
+
+def _write_config(config_file, content):
+    """Replace the config file atomically via a temp file in the same directory"""
+    directory = os.path.dirname(os.path.abspath(config_file))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".email_config.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        shutil.copymode(config_file, tmp_path)
+        os.replace(tmp_path, config_file)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def _remember_config(config_file, content):
+    """Record freshly written config text so the next save can skip the read"""
+    global _config_cache
+    stat = os.stat(config_file)
+    _config_cache = (config_file, stat.st_mtime_ns, stat.st_size, content)
 
 def save_configuration():
     """Save the configuration to email_config.py"""
@@ -110,44 +240,21 @@ def save_configuration():
     
     # Read the current email_config.py file
     config_file = "email_config.py"
-    if not os.path.exists(config_file):
-        print("Error: email_config.py not found")
-        return False
-    
     try:
-        with open(config_file, 'r', encoding='utf-8') as f:
-            content = f.read()
+        content = _read_config(config_file)
         
         # Update the EMAIL_SETTINGS section
         search_range = EMAIL_SETTINGS["search_range"]
         
         # Create the new EMAIL_SETTINGS string
-        new_settings = f'''EMAIL_SETTINGS = {{
-    "email_address": email_address,  # Replace with your email
-    "password": password,  # Will prompt for password if None
-    "folder_name": folder_name,  # Email folder to search
-    "download_path": "./files",  # Path to save attachments
-    "file_types": ['.xls', '.xlsx'],  # File types to download
-    "search_range": {{
-        "enabled": {search_range["enabled"]},  # Set to True to use search range
-        "type": "{search_range["type"]}",  # Options: "all", "date_range", "count_limit", "recent_days"
-        "date_range": {{
-            "start_date": "{search_range["date_range"]["start_date"]}",  # Format: YYYYMMDD
-            "end_date": "{search_range["date_range"]["end_date"]}"     # Format: YYYYMMDD
-        }},
-        "count_limit": {search_range["count_limit"]},  # Maximum number of emails to process
-        "recent_days": {search_range["recent_days"]},   # Process emails from last N days
-        "batch_size": {search_range["batch_size"]}     # Number of emails to process in each batch
-    }}
-}}'''
-        
-        # Find and replace the EMAIL_SETTINGS section
-        # Use a more specific pattern to match the entire EMAIL_SETTINGS block
-        pattern = r'EMAIL_SETTINGS\s*=\s*\{[^}]*"search_range":\s*\{[^}]*\}[^}]*\}'
-        new_content = re.sub(pattern, new_settings, content, flags=re.DOTALL)
-        
-        # If the pattern didn't match, try a simpler approach
-        if new_content == content:
+        new_settings = format_email_settings(EMAIL_SETTINGS)
+        
+        # Find the EMAIL_SETTINGS section between the sentinel comments
+        start = content.find(SETTINGS_BEGIN)
+        end = content.find(SETTINGS_END, start) if start != -1 else -1
+        
+        # If the sentinels are missing, ask for a manual update instead
+        if end == -1:
             print("Warning: Could not find EMAIL_SETTINGS section to replace.")
             print("Please manually update the search_range settings in email_config.py:")
             print(f"  enabled: {search_range['enabled']}")
@@ -155,13 +262,18 @@ def save_configuration():
             print(f"  batch_size: {search_range['batch_size']}")
             return False
         
+        new_content = content[:start + len(SETTINGS_BEGIN)] + "\n" + new_settings + "\n" + content[end:]
+        
         # Write the updated content back to the file
-        with open(config_file, 'w', encoding='utf-8') as f:
-            f.write(new_content)
+        _write_config(config_file, new_content)
+        _remember_config(config_file, new_content)
         
         print("✓ Configuration saved to email_config.py")
         return True
         
+    except FileNotFoundError:
+        print("Error: email_config.py not found")
+        return False
     except Exception as e:
         print(f"Error saving configuration: {e}")
         return False
@@ -175,14 +287,11 @@ def main():
     display_current_config()
     
     # Ask if user wants to change configuration
-    change = input("Do you want to change the search range configuration? (y/n): ").lower().strip()
-    
-    if change == 'y':
+    if _yes("Do you want to change the search range configuration? (y/n): "):
         configure_search_range()
         
         # Ask if user wants to save
-        save = input("\nDo you want to save this configuration? (y/n): ").lower().strip()
-        if save == 'y':
+        if _yes("\nDo you want to save this configuration? (y/n): "):
             if not save_configuration():
                 print("Please manually update email_config.py with the new settings.")
         else:
@@ -1,14 +1,16 @@
 import os
-from dotenv import load_dotenv
 # Email Configuration
 # Update these settings according to your email provider
+# max_connections: IMAP connections used in parallel for downloads; keep it below
+# the provider's per-account limit (Gmail allows 15), or set 1 for a single one
 
 # Gmail Configuration
 GMAIL_CONFIG = {
     "imap_server": "imap.gmail.com",
     "imap_port": 993,
     "smtp_server": "smtp.gmail.com",
-    "smtp_port": 587
+    "smtp_port": 587,
+    "max_connections": 4
 }
 
 # Outlook/Hotmail Configuration
@@ -16,7 +18,8 @@ OUTLOOK_CONFIG = {
     "imap_server": "outlook.office365.com",
     "imap_port": 993,
     "smtp_server": "smtp-mail.outlook.com",
-    "smtp_port": 587
+    "smtp_port": 587,
+    "max_connections": 4
 }
 
 # Yahoo Configuration
@@ -24,7 +27,8 @@ YAHOO_CONFIG = {
     "imap_server": "imap.mail.yahoo.com",
     "imap_port": 993,
     "smtp_server": "smtp.mail.yahoo.com",
-    "smtp_port": 587
+    "smtp_port": 587,
+    "max_connections": 4
 }
 
 # QQ Mail Configuration
@@ -32,7 +36,8 @@ QQ_CONFIG = {
     "imap_server": "imap.qq.com",
     "imap_port": 993,
     "smtp_server": "smtp.qq.com",
-    "smtp_port": 587
+    "smtp_port": 587,
+    "max_connections": 4
 }
 
 # 163 Mail Configuration
@@ -40,7 +45,8 @@ MAIL163_CONFIG = {
     "imap_server": "imap.163.com",
     "imap_port": 993,
     "smtp_server": "smtp.163.com",
-    "smtp_port": 587
+    "smtp_port": 587,
+    "max_connections": 4
 }
 
 # Wangyi Corporate Mail Configuration
@@ -48,7 +54,8 @@ WANGYI_CONFIG = {
     "imap_server": "imap.qiye.163.com",
     "imap_port": 993,
     "smtp_server": "smtp.qiye.163.com",
-    "smtp_port": 465
+    "smtp_port": 465,
+    "max_connections": 4
 }
 
 # Default configuration (change this to your email provider)
@@ -56,13 +63,20 @@ DEFAULT_CONFIG = WANGYI_CONFIG
 
 # Your email settings (update these)
 # Load email address, password and folder name from credentials.env
-# load env
-load_dotenv('credentials.env')
+def load_credentials(env_file='credentials.env'):
+    """Read account settings from the environment, falling back to env_file"""
+    # python-dotenv never overrides variables that are already set, so only
+    # import it when the file exists and could still supply something
+    names = ("email_address", "password", "folder_name")
+    if not all(os.getenv(name) for name in names) and os.path.exists(env_file):
+        from dotenv import load_dotenv
+        load_dotenv(env_file)
+    return os.getenv("email_address"), os.getenv("password"), os.getenv("folder_name") or "INBOX"
+
 # read account and password
-email_address = os.getenv("email_address")
-password = os.getenv("password")
-folder_name = os.getenv("folder_name") or "INBOX"
+email_address, password, folder_name = load_credentials()
 
+# <<<EMAIL_SETTINGS>>>
 EMAIL_SETTINGS = {
     "email_address": email_address,  # Replace with your email
     "password": password,  # Will prompt for password if None
@@ -80,4 +94,5 @@ EMAIL_SETTINGS = {
         "recent_days": 7,   # Process emails from last N days
         "batch_size": 50     # Number of emails to process in each batch
     }
-}
\ No newline at end of file
+}
+# <<<END>>>
@@ -1,13 +1,562 @@
 import imaplib
+import binascii
 import email
+import email.utils
 import os
+import queue
+import re
+import ssl
 import getpass
+import hashlib
+import json
+import logging
+import logging.handlers
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
 from email.header import decode_header
-from datetime import datetime
-import pandas as pd
+from email.parser import BytesHeaderParser
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+# Optional C charset detector, used when bytes are neither ASCII nor UTF-8
+try:
+    import cchardet as chardet
+except ImportError:
+    try:
+        import chardet
+    except ImportError:
+        chardet = None
+
+# Largest number of messages requested in one FETCH command; servers reject
+# overly long commands and imap_tools found 100 to be a good trade-off. A server
+# that still answers BAD gets smaller commands from then on (see _fetch_pipelined)
+MAX_FETCH_BATCH = 100
+
+# imaplib refuses response lines over 1 MB, and the SEARCH reply listing a folder of
+# more than about 140,000 messages is one such line; allow 10 MB (process-wide)
+imaplib._MAXLINE = max(imaplib._MAXLINE, 10_000_000)
+
+# Servers such as Gmail and iCloud drop connections idle for about 30 minutes,
+# so send a NOOP after 25 idle minutes (checked every 5 minutes)
+KEEPALIVE_IDLE = 1500
+KEEPALIVE_CHECK = 300
+
+# FETCH commands kept outstanding at once; replies to later commands arrive
+# while earlier ones are being processed instead of after another round trip
+PIPELINE_DEPTH = 4
+
+# Threads that decode and write attachments while the next batch is fetched
+WRITER_THREADS = 4
+# Fetched attachments allowed to wait for a writer thread; beyond this, fetching
+# pauses so a slow disk cannot pile downloaded data up in memory
+WRITE_BACKLOG = 8
+
+# Attachments are written to a .part file and renamed once complete. Setting the
+# environment variable SYNC_ATTACHMENTS=1 also flushes each one to disk before the
+# rename, so even a power cut leaves no truncated file; off by default as fsync is slow
+SYNC_ATTACHMENTS = os.getenv('SYNC_ATTACHMENTS') == '1'
+
+# Attachments larger than LARGE_SECTION (encoded size, from BODYSTRUCTURE) are fetched
+# PARTIAL_FETCH bytes at a time and handed to a writer thread as the pieces arrive, so
+# a big file never has to fit in memory; about 2 * PIPELINE_DEPTH pieces are held at once
+LARGE_SECTION = 4 * 1024 * 1024
+PARTIAL_FETCH = 1024 * 1024
+
+# Phase one of a download: the MIME layout and subject of each message, without
+# marking anything \Seen (BODY.PEEK) or transferring attachment data
+STRUCTURE_ITEMS = '(BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS (SUBJECT)])'
+
+logger = logging.getLogger(__name__)
+
+# Shared headers-only parser (stateless between parsebytes() calls, so safe to reuse)
+_HEADER_PARSER = BytesHeaderParser()
+
+# Encodings tried in order after the declared charset, UTF-8 and any detected one
+FALLBACK_ENCODINGS = ('gbk', 'gb2312', 'big5', 'latin1', 'cp1252')
+
+# Attachments are decoded and written this many encoded bytes at a time; larger
+# blocks mean fewer write() calls but measured slower overall (CPU cache misses)
+STREAM_BLOCK = 64 * 1024
+# Windows and macOS file systems ignore case by default: Report.XLSX and report.xlsx
+# name the same file there
+_CASE_INSENSITIVE_FS = os.name == 'nt' or sys.platform == 'darwin'
+
+# Every byte outside the base64 alphabet (line breaks, padding), for bytes.translate()
+_BASE64_NOISE = bytes(set(range(256)) - set(b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/'))
+
+# Tokens of an IMAP response: parentheses, quoted strings and atoms, where an
+# atom such as BODY[HEADER.FIELDS (SUBJECT)]<0> keeps its bracketed section
+_IMAP_TOKEN_RE = re.compile(rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|([^\s()"\[]+(?:\[[^\]]*\](?:<\d+>)?)?))')
+_FETCH_START_RE = re.compile(rb'(\d+) \(')
+
+def configure_logging(level=None):
+    """
+    Send log output to stdout, the way the scripts printed progress before
+    
+    Per-email details are logged at DEBUG; set the LOG_LEVEL environment
+    variable to DEBUG to see them. Records are buffered and written out in bulk
+    whenever an INFO or more severe record arrives, so they stay in order.
+    
+    Args:
+        level (str): Logging level name; defaults to $LOG_LEVEL or INFO
+    """
+    root = logging.getLogger()
+    if any(isinstance(handler, logging.handlers.MemoryHandler) for handler in root.handlers):
+        return
+    
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(logging.Formatter('%(message)s'))
+    root.addHandler(logging.handlers.MemoryHandler(capacity=1000, flushLevel=logging.INFO, target=stream))
+    root.setLevel((level or os.getenv('LOG_LEVEL') or 'INFO').upper())
+
+@lru_cache(maxsize=None)
+def _ascii_compatible(charset):
+    """Whether charset reads ASCII bytes as ASCII (7-bit ones such as ISO-2022-JP and UTF-7 do not)"""
+    # Shift sequences of ISO-2022-JP, ISO-2022-KR, UTF-7 and HZ, which otherwise decode as plain ASCII
+    probe = b'\x1b$BF|\x1b(B \x1b$)C\x0e!!\x0f +AGE- ~{<:~}'
+    try:
+        return probe.decode(charset) == probe.decode('ascii')
+    except LookupError:
+        # Unknown charsets can't be used to decode anything anyway
+        return True
+    except UnicodeDecodeError:
+        return False
+
+@lru_cache(maxsize=4096)
+def _decode_bytes(data, default_encoding='utf-8', charset=None):
+    """
+    Decode header or filename bytes; cached because the same fragments recur across emails
+    
+    Args:
+        data (bytes): Text to decode
+        default_encoding (str): Encoding tried first unless a charset is declared
+        charset (str): Charset declared for the text (e.g. by decode_header), if any
+    """
+    if data.isascii() and (not charset or _ascii_compatible(charset)):
+        return data.decode('ascii')
+    
+    encodings = [charset] if charset else []
+    encodings.append(default_encoding)
+    if chardet is not None:
+        guess = chardet.detect(data)
+        # Short strings give unreliable guesses, so only trust confident ones
+        if guess.get('encoding') and (guess.get('confidence') or 0) >= 0.9:
+            encodings.append(guess['encoding'])
+    encodings.extend(FALLBACK_ENCODINGS)
+    
+    for encoding in encodings:
+        try:
+            return data.decode(encoding)
+        except (UnicodeDecodeError, LookupError):
+            continue
+    
+    # If all encodings fail, use 'replace' to handle invalid characters
+    return data.decode(default_encoding, errors='replace')
+
+def _parse_imap_list(pieces):
+    """
+    Parse response text and literals into nested lists
+    
+    Args:
+        pieces (list): bytes chunks of response text, each optionally followed by
+            a literal (also bytes) in a (text, literal) tuple
+        
+    Returns:
+        list: Top-level values; lists for parenthesized groups, bytes for strings
+        and atoms, None for NIL
+    """
+    stack = [[]]
+    for piece in pieces:
+        text, literal = piece if isinstance(piece, tuple) else (piece, None)
+        if literal is not None:
+            # Drop the {size} marker that announced the literal
+            text = text[:text.rindex(b'{')]
+        
+        pos = 0
+        while True:
+            match = _IMAP_TOKEN_RE.match(text, pos)
+            if not match or match.end() == pos:
+                break
+            pos = match.end()
+            open_paren, close_paren, quoted, atom = match.groups()
+            if open_paren:
+                stack.append([])
+            elif close_paren:
+                group = stack.pop()
+                stack[-1].append(group)
+            elif quoted is not None:
+                stack[-1].append(re.sub(rb'\\(.)', rb'\1', quoted))
+            else:
+                stack[-1].append(None if atom.upper() == b'NIL' else atom)
+        
+        if literal is not None:
+            stack[-1].append(literal)
+    return stack[0]
+
+def _parse_fetch_response(data):
+    """
+    Split imaplib FETCH data into one item dictionary per message
+    
+    Yields:
+        tuple: (message_number, {ITEM_NAME: value}) with upper-cased str item names
+    """
+    message = None
+    for piece in data:
+        text = piece[0] if isinstance(piece, tuple) else piece
+        if _FETCH_START_RE.match(text):
+            if message:
+                yield _fetch_items(message)
+            message = [piece]
+        elif message is not None:
+            message.append(piece)
+    if message:
+        yield _fetch_items(message)
+
+def _fetch_items(pieces):
+    """Turn the parsed pieces of one FETCH response into (number, items)"""
+    number, values = _parse_imap_list(pieces)[:2]
+    items = {}
+    for i in range(0, len(values) - 1, 2):
+        items[values[i].decode('ascii').upper()] = values[i + 1]
+    return int(number), items
+
+def _decode_param(value):
+    """Decode a BODYSTRUCTURE string value"""
+    return value.decode('utf-8', errors='surrogateescape') if isinstance(value, bytes) else value
+
+def _bodystructure_param(params, name):
+    """Look up a parameter in a BODYSTRUCTURE parameter list, handling RFC 2231 encoding"""
+    if not isinstance(params, list):
+        return None
+    pairs = [(_decode_param(params[i]).lower(), _decode_param(params[i + 1]))
+             for i in range(0, len(params) - 1, 2)]
+    # decode_params() treats the first pair as the header value itself
+    for key, value in email.utils.decode_params([('', '')] + pairs)[1:]:
+        if key == name:
+            # Unquote the way Message.get_param() does before collapsing
+            if isinstance(value, tuple):
+                value = value[:2] + (email.utils.unquote(value[2]),)
+            return email.utils.collapse_rfc2231_value(value).strip()
+    return None
+
+@lru_cache(maxsize=8192)
+def _decode_header(header):
+    """decode_header() for a header string; cached because thread subjects and filenames recur"""
+    return tuple(decode_header(header))
+
+def _extension_filter(file_types):
+    """Turn a list of file extensions into the frozenset of lower-cased ones, or None for no filter"""
+    return frozenset(file_type.lower() for file_type in file_types) if file_types else None
+
+def _extension(filename):
+    """Lower-cased extension of filename with its dot, as os.path.splitext() finds it but cheaper"""
+    dot = filename.rfind('.')
+    # Leading dots (".xlsx") start a name rather than an extension
+    if dot > 0 and filename[:dot].lstrip('.'):
+        return filename[dot:].lower()
+    return ''
+
+def _excluded_by_extension(filename, file_types):
+    """
+    Cheap file type check on a raw attachment filename, before any header decoding
+    
+    Returns True only for names without RFC 2047 encoded words (which can hide the
+    extension) whose extension is not one of file_types (from _extension_filter()).
+    """
+    if not file_types or not filename or '=?' in filename:
+        return False
+    return _extension(filename.strip()) not in file_types
+
+def _walk_bodystructure(structure, prefix=''):
+    """
+    Yield the attachments described by a parsed BODYSTRUCTURE
+    
+    A part counts as an attachment under the same rule used for parsed messages:
+    it is not multipart, has a Content-Disposition and has a filename.
+    
+    Args:
+        structure (list): Parsed BODYSTRUCTURE of a message (or of an attached message)
+        prefix (str): Section number of the enclosing message/rfc822 part plus '.'
+        
+    Yields:
+        tuple: (section, filename, encoding, size) with section such as '2' or '3.1'
+    """
+    if isinstance(structure[0], list):
+        for number, child in enumerate((part for part in structure if isinstance(part, list)), 1):
+            yield from _walk_bodystructure_part(child, f"{prefix}{number}")
+    else:
+        yield from _walk_bodystructure_part(structure, f"{prefix}1")
+
+def _walk_bodystructure_part(part, section):
+    """Yield the attachments within one body part (see _walk_bodystructure)"""
+    if isinstance(part[0], list):
+        # Nested multipart: children are numbered below this section
+        for number, child in enumerate((sub for sub in part if isinstance(sub, list)), 1):
+            yield from _walk_bodystructure_part(child, f"{section}.{number}")
+        return
+    
+    maintype = _decode_param(part[0]).lower()
+    subtype = _decode_param(part[1]).lower()
+    is_message = maintype == 'message' and subtype == 'rfc822'
+    
+    # Extension data follows the type-specific fields: MD5, then disposition
+    extension = 8 if maintype == 'text' else 10 if is_message else 7
+    disposition = part[extension + 1] if len(part) > extension + 1 else None
+    if isinstance(disposition, list) and disposition:
+        filename = (_bodystructure_param(disposition[1] if len(disposition) > 1 else None, 'filename')
+                    or _bodystructure_param(part[2], 'name'))
+        if filename:
+            encoding = _decode_param(part[5] or b'7bit').lower()
+            yield section, filename, encoding, int(part[6] or 0)
+    
+    if is_message and len(part) > 8 and isinstance(part[8], list):
+        yield from _walk_bodystructure(part[8], f"{section}.")
+
+def _decode_blocks(chunks, encoding):
+    """Undo a Content-Transfer-Encoding over a sequence of encoded chunks, one decoded block at a time"""
+    if encoding == 'base64':
+        leftover = b''
+        for data in chunks:
+            for start in range(0, len(data), STREAM_BLOCK):
+                # translate() drops the line breaks several times faster than a regex
+                block = data[start:start + STREAM_BLOCK].translate(None, _BASE64_NOISE)
+                if leftover:
+                    block = leftover + block
+                # Decode whole 4-character groups and carry the rest into the next block
+                cut = len(block) - len(block) % 4
+                leftover = block[cut:]
+                yield binascii.a2b_base64(memoryview(block)[:cut])
+        if len(leftover) > 1:
+            yield binascii.a2b_base64(leftover + b'==')
+    elif encoding == 'quoted-printable':
+        tail = b''
+        for data in chunks:
+            if tail:
+                data = tail + data
+            # Slicing a memoryview (and decoding straight from one) copies none of the encoded data
+            view = memoryview(data)
+            # Cut after line breaks only, so no =XX escape or soft line break is split;
+            # an unfinished last line waits for the next chunk
+            last = data.rfind(b'\n') + 1
+            start = 0
+            while start < last:
+                end = data.find(b'\n', start + STREAM_BLOCK)
+                end = last if end == -1 else end + 1
+                yield binascii.a2b_qp(view[start:end])
+                start = end
+            tail = data[last:]
+        if tail:
+            yield binascii.a2b_qp(tail)
+    else:
+        yield from chunks
+
+class _AttachmentIndex:
+    """
+    SHA-256 index of the attachments saved in a download folder, kept in a JSON sidecar
+    
+    Identical attachments arriving under different names are stored once: later names
+    are recorded as aliases of the first file and count as already downloaded.
+    """
+    FILENAME = '.index.json'
+    
+    def __init__(self, download_path):
+        self.download_path = download_path
+        self.path = os.path.join(download_path, self.FILENAME)
+        self.files = {}    # SHA-256 hex digest -> file name
+        self.aliases = {}  # alias file name -> file name holding the same content
+        self._dirty = False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.files = dict(data.get('files', {}))
+            self.aliases = dict(data.get('aliases', {}))
+        except (OSError, ValueError, AttributeError):
+            pass
+    
+    def alias_path(self, name):
+        """Return the path of the file that an alias name stands for, if it still exists"""
+        target = self.aliases.get(name)
+        if target:
+            path = os.path.join(self.download_path, target)
+            if os.path.exists(path):
+                return path
+        return None
+    
+    def store(self, staged_path, file_path, digest):
+        """
+        Move a staged download to file_path, unless identical content is already saved
+        
+        Returns:
+            str: Path of the file holding the content, file_path or the earlier file
+        """
+        name = os.path.basename(file_path)
+        existing = self.files.get(digest)
+        self._dirty = True
+        if existing and existing != name and os.path.exists(os.path.join(self.download_path, existing)):
+            os.remove(staged_path)
+            self.aliases[name] = existing
+            return os.path.join(self.download_path, existing)
+        
+        os.replace(staged_path, file_path)
+        self.files[digest] = name
+        return file_path
+    
+    def save(self):
+        """Write the index back to its sidecar file if anything changed"""
+        if not self._dirty:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'files': self.files, 'aliases': self.aliases}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+def _write_attachment(file_path, chunks, encoding):
+    """
+    Decode a transfer-encoded payload, given as a sequence of chunks, straight to disk
+    
+    Returns:
+        str: SHA-256 hex digest of the decoded content
+    """
+    digest = hashlib.sha256()
+    # O_BINARY keeps Windows from translating line endings
+    fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o666)
+    try:
+        for block in _decode_blocks(chunks, encoding):
+            digest.update(block)
+            view = memoryview(block)
+            while view:
+                view = view[os.write(fd, view):]
+        if SYNC_ATTACHMENTS:
+            os.fsync(fd)
+    finally:
+        os.close(fd)
+    return digest.hexdigest()
+
+@lru_cache(maxsize=None)
+def _default_ssl_context():
+    """
+    TLS settings shared by every connection that is not given its own
+    
+    imaplib's default context does not verify the server certificate; this one does.
+    Loading the trusted certificates takes tens of milliseconds, so it is done once.
+    """
+    return ssl.create_default_context()
+
+def _claim_key(file_path):
+    """Form of file_path kept in the set of claimed paths: case-folded where file names ignore case"""
+    return os.path.normcase(file_path).casefold() if _CASE_INSENSITIVE_FS else file_path
+
+def _make_download_dir(download_path):
+    """Create the download directory unless it already exists (a single makedirs call)"""
+    try:
+        os.makedirs(download_path)
+        logger.info(f"Created directory: {download_path}")
+    except FileExistsError:
+        pass
+
+class _AttachmentWriter:
+    """Writer threads running _write_attachment(), with a bounded backlog"""
+    
+    def __init__(self, threads=WRITER_THREADS, backlog=WRITE_BACKLOG):
+        self._executor = ThreadPoolExecutor(max_workers=threads)
+        self._slots = threading.BoundedSemaphore(threads + backlog)
+    
+    def submit(self, file_path, data, encoding):
+        """
+        Start decoding data into file_path + '.part', waiting while the backlog is full
+        
+        Returns:
+            Future: Resolves to the SHA-256 hex digest from _write_attachment()
+        """
+        return self._start(file_path, (data,), encoding)
+    
+    def stream(self, file_path, chunks, encoding):
+        """
+        Decode chunks, a generator reading from an IMAP connection, into file_path + '.part'
+        
+        The calling thread keeps pulling the chunks (so the connection stays with it) and
+        passes them to a writer thread through a short queue; this returns once the last
+        chunk has been handed over.
+        
+        Returns:
+            Future: As for submit(); fails if the server's data was unusable
+            
+        Raises:
+            imaplib.IMAP4.abort, OSError: The connection failed; the partial file is removed
+        """
+        handoff = queue.Queue(PIPELINE_DEPTH)
+        future = self._start(file_path, _drain(handoff), encoding)
+        
+        def hand_over(item):
+            # A writer that failed stops reading, so never wait on it for good
+            while not future.done():
+                try:
+                    handoff.put(item, timeout=1)
+                    return
+                except queue.Full:
+                    pass
+        
+        try:
+            for chunk in chunks:
+                hand_over(chunk)
+                if future.done():
+                    break
+        except (imaplib.IMAP4.abort, OSError) as e:
+            hand_over(e)
+            wait((future,))
+            _discard(file_path + '.part')
+            raise
+        except Exception as e:
+            hand_over(e)
+        else:
+            hand_over(None)
+        finally:
+            chunks.close()
+        return future
+    
+    def _start(self, file_path, chunks, encoding):
+        """Run _write_attachment() on a writer thread once a backlog slot is free"""
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(_write_attachment, file_path + '.part', chunks, encoding)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+    
+    def shutdown(self):
+        """Wait for the writes still running and stop the threads"""
+        self._executor.shutdown()
+
+def _drain(handoff):
+    """Yield the chunks put on a queue up to a None, raising an exception put there instead"""
+    while True:
+        chunk = handoff.get()
+        if chunk is None:
+            return
+        if isinstance(chunk, BaseException):
+            raise chunk
+        yield chunk
+
+def _discard(path):
+    """Remove a partially written file, if there is one"""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
 
 class EmailAttachmentDownloader:
-    def __init__(self, email_address, password=None, imap_server="imap.gmail.com", imap_port=993):
+    # Characters not allowed in filenames, all replaced by '_' in one pass
+    _INVALID_TRANS = str.maketrans({char: '_' for char in '<>:"/\\|?*'})
+    _UNNAMED_FILE = "unnamed_file"
+    
+    def __init__(self, email_address, password=None, imap_server="imap.gmail.com", imap_port=993, max_connections=4,
+                 ssl_context=None):
         """
         Initialize the email downloader
         
@@ -16,33 +565,227 @@ class EmailAttachmentDownloader:
             password (str): Your email password or app password
             imap_server (str): IMAP server address
             imap_port (int): IMAP server port
+            max_connections (int): IMAP connections used in parallel while downloading;
+                providers typically allow somewhere between 5 and 15 per account
+            ssl_context (ssl.SSLContext): TLS settings for every connection; defaults to
+                one shared context that verifies the server certificate
         """
         self.email_address = email_address
         self.password = password or getpass.getpass("Enter your email password: ")
         self.imap_server = imap_server
         self.imap_port = imap_port
+        self.max_connections = max(1, max_connections)
+        self.ssl_context = ssl_context or _default_ssl_context()
         self.mail = None
+        # Guards self.mail against the keep-alive thread
+        self._lock = threading.RLock()
+        self._keepalive = None
+        self._last_activity = time.monotonic()
+        # (folder_name, readonly) of the last successful SELECT, restored on reconnect
+        self._current_folder = None
+        # Messages per FETCH command; lowered if the server rejects a long message set
+        self._fetch_limit = MAX_FETCH_BATCH
+        # STRUCTURE_ITEMS already fetched from the selected folder, by message number,
+        # so that counting and then downloading scans the folder only once
+        self._structure_cache = {}
+        # (folder_name, EXISTS, UIDVALIDITY, UIDNEXT) the cache is valid for
+        self._structure_state = None
+        # Folder names from LIST, as a list and a set, kept for as long as the connection lasts
+        self._folders = None
+        self._folder_set = frozenset()
         
     def connect(self):
         """Connect to the email server"""
         try:
-            self.mail = imaplib.IMAP4_SSL(self.imap_server, self.imap_port)
+            self._folders = None
+            self._folder_set = frozenset()
+            self.mail = imaplib.IMAP4_SSL(self.imap_server, self.imap_port, ssl_context=self.ssl_context)
             self.mail.login(self.email_address, self.password)
-            print(f"Successfully connected to {self.email_address}")
+            self._last_activity = time.monotonic()
+            self._schedule_keepalive()
+            logger.info(f"Successfully connected to {self.email_address}")
             return True
         except Exception as e:
-            print(f"Failed to connect: {e}")
+            logger.error(f"Failed to connect: {e}")
             return False
     
     def disconnect(self):
         """Disconnect from the email server"""
+        if self._keepalive:
+            self._keepalive.cancel()
+            self._keepalive = None
         if self.mail:
             self.mail.logout()
-            print("Disconnected from email server")
+            logger.info("Disconnected from email server")
+    
+    def _schedule_keepalive(self):
+        """(Re)start the timer that keeps an idle connection open"""
+        if self._keepalive:
+            self._keepalive.cancel()
+        self._keepalive = threading.Timer(KEEPALIVE_CHECK, self._keepalive_tick)
+        self._keepalive.daemon = True
+        self._keepalive.start()
+    
+    def _keepalive_tick(self):
+        """Send a NOOP if the connection has been idle, unless it is in use right now"""
+        if time.monotonic() - self._last_activity >= KEEPALIVE_IDLE and self._lock.acquire(blocking=False):
+            try:
+                self.mail.noop()
+                self._last_activity = time.monotonic()
+            except Exception:
+                pass  # The next command will reconnect
+            finally:
+                self._lock.release()
+        self._schedule_keepalive()
+    
+    def _reconnect(self):
+        """
+        Replace a dropped connection and reselect the folder that was open
+        
+        Returns:
+            bool: True if the new connection is ready for use
+        """
+        logger.warning("Connection to email server lost, reconnecting...")
+        try:
+            self.mail.shutdown()
+        except Exception:
+            pass
+        if not self.connect():
+            return False
+        if self._current_folder:
+            folder_name, readonly = self._current_folder
+            status, data = self.mail.select(folder_name, readonly=readonly)
+            if status != 'OK':
+                return False
+            self._check_structure_cache(folder_name, data)
+        return True
     
-    def _safe_decode(self, text, default_encoding='utf-8'):
+    def _imap(self, command, *args, **kwargs):
         """
-        Safely decode text with fallback encodings
+        Run an IMAP command on self.mail, reconnecting and retrying once if the
+        server has dropped the connection
+        """
+        for attempt in range(2):
+            try:
+                with self._lock:
+                    result = getattr(self.mail, command)(*args, **kwargs)
+                    self._last_activity = time.monotonic()
+            except (imaplib.IMAP4.abort, OSError):
+                if attempt or not self._reconnect():
+                    raise
+                continue
+            
+            if command == 'select' and result[0] == 'OK':
+                self._current_folder = (args[0], kwargs.get('readonly', False))
+                self._check_structure_cache(args[0], result[1])
+            return result
+    
+    def _check_structure_cache(self, folder_name, exists):
+        """
+        Drop cached structures unless the folder just selected is unchanged since they were fetched
+        
+        Message numbers stay the same only while no message is added or expunged, which
+        EXISTS, UIDVALIDITY and UIDNEXT together show. Without all three nothing is cached.
+        
+        Args:
+            folder_name (str): Folder that was selected
+            exists (list): Data of the SELECT reply (the EXISTS count)
+        """
+        untagged = self.mail.untagged_responses
+        state = (folder_name,) + tuple(values[-1] if values else None for values in
+                                       (exists, untagged.get('UIDVALIDITY'), untagged.get('UIDNEXT')))
+        if None in state:
+            state = None
+        if state is None or state != self._structure_state:
+            self._structure_cache = {}
+        self._structure_state = state
+    
+    def _attachment_search(self, criteria, file_types):
+        """
+        Narrow SEARCH criteria to messages that may hold matching attachments
+        
+        Gmail (X-GM-EXT-1) has its own attachment search, which can also match
+        filenames; it does not reliably index MIME headers, so header searches are
+        never sent there. Other servers can only search headers: an attachment needs a
+        multipart message, or a single-part message carrying its own
+        Content-Disposition. That header search is a best-effort filter: whatever the
+        server lists in an OK reply is trusted, and only a rejected search falls back
+        to the plain criteria (see _search_attachments).
+        
+        Args:
+            criteria (str): SEARCH criteria, e.g. 'ALL'
+            file_types (list): List of file extensions to download
+        """
+        if 'X-GM-EXT-1' in self.mail.capabilities:
+            query = 'has:attachment'
+            extensions = sorted({file_type.lower().lstrip('.') for file_type in file_types or ()})
+            if extensions and all(ext.isalnum() for ext in extensions):
+                query += ' (' + ' OR '.join(f'filename:{ext}' for ext in extensions) + ')'
+            logger.info(f"Filtering on the server: {query}")
+            narrowed = f'X-GM-RAW "{query}"'
+        else:
+            narrowed = 'OR HEADER Content-Type "multipart/" HEADER Content-Disposition ""'
+        return narrowed if criteria == 'ALL' else f'{criteria} {narrowed}'
+    
+    def _search_attachments(self, criteria, file_types):
+        """
+        SEARCH the selected folder for messages that may hold matching attachments
+        
+        Uses the narrowed criteria from _attachment_search(), repeating the search with
+        the plain criteria if the server rejects them.
+        
+        Returns:
+            tuple: (status, data) as from IMAP4.search()
+        """
+        try:
+            status, data = self._imap('search', None, self._attachment_search(criteria, file_types))
+            if status == 'OK':
+                return status, data
+        except imaplib.IMAP4.abort:
+            raise
+        except imaplib.IMAP4.error:
+            pass
+        logger.info("Server-side filtering not supported, searching all emails")
+        return self._imap('search', None, criteria)
+    
+    def _open_pool(self, folder_name):
+        """
+        Open the extra connections used to download in parallel
+        
+        Args:
+            folder_name (str): Folder to select (read-only) on each connection
+            
+        Returns:
+            list: Logged-in connections with the folder selected; possibly fewer than
+            requested if the server refuses some of them
+        """
+        pool = []
+        for _ in range(self.max_connections - 1):
+            try:
+                mail = imaplib.IMAP4_SSL(self.imap_server, self.imap_port, ssl_context=self.ssl_context)
+                mail.login(self.email_address, self.password)
+                status, _ = mail.select(folder_name, readonly=True)
+                if status != 'OK':
+                    mail.logout()
+                    break
+                pool.append(mail)
+            except Exception as e:
+                logger.warning(f"Using {len(pool) + 1} connection(s); could not open another: {e}")
+                break
+        return pool
+    
+    def _close_pool(self, pool):
+        """Log out the connections opened by _open_pool()"""
+        for mail in pool:
+            try:
+                mail.logout()
+            except Exception:
+                pass
+    
+    @staticmethod
+    def _safe_decode(text, default_encoding='utf-8', charset=None):
+        """
+        Safely decode text with fallback encodings, preferring a declared charset
         """
         if isinstance(text, str):
             return text
@@ -50,32 +793,23 @@ class EmailAttachmentDownloader:
         if not isinstance(text, bytes):
             return str(text)
         
-        # Try different encodings
-        encodings = [default_encoding, 'gbk', 'gb2312', 'big5', 'latin1', 'cp1252']
-        
-        for encoding in encodings:
-            try:
-                return text.decode(encoding)
-            except (UnicodeDecodeError, LookupError):
-                continue
-        
-        # If all encodings fail, use 'replace' to handle invalid characters
         try:
-            return text.decode(default_encoding, errors='replace')
+            return _decode_bytes(text, default_encoding, charset)
         except:
             return str(text)
     
-    def _decode_filename(self, filename):
+    @classmethod
+    @lru_cache(maxsize=8192)
+    def _decode_filename(cls, filename):
         """
-        Decode MIME-encoded filename properly
+        Decode MIME-encoded filename properly (cached, as the same names recur across emails)
         """
         if not filename:
             return ""
         
         try:
             # Use email.header.decode_header to properly decode MIME-encoded filenames
-            from email.header import decode_header
-            decoded_parts = decode_header(filename)
+            decoded_parts = _decode_header(filename)
             
             # Combine all decoded parts
             decoded_filename = ""
@@ -85,9 +819,9 @@ class EmailAttachmentDownloader:
                         try:
                             decoded_filename += part.decode(encoding)
                         except:
-                            decoded_filename += self._safe_decode(part)
+                            decoded_filename += cls._safe_decode(part)
                     else:
-                        decoded_filename += self._safe_decode(part)
+                        decoded_filename += cls._safe_decode(part)
                 else:
                     decoded_filename += str(part)
             
@@ -95,16 +829,18 @@ class EmailAttachmentDownloader:
             
         except Exception as e:
             # Fallback to simple decoding
-            return self._safe_decode(filename)
+            return cls._safe_decode(filename)
     
     def list_folders(self):
-        """List all available folders"""
+        """List all available folders (LISTed once per connection)"""
         if not self.mail:
-            print("Not connected to email server")
+            logger.error("Not connected to email server")
             return []
+        if self._folders is not None:
+            return list(self._folders)
         
         try:
-            status, folders = self.mail.list()
+            status, folders = self._imap('list')
             folder_list = []
             for folder in folders:
                 try:
@@ -119,13 +855,643 @@ class EmailAttachmentDownloader:
                     folder_name = self._safe_decode(folder_name.encode('latin1') if isinstance(folder_name, str) else folder_name)
                     folder_list.append(folder_name)
                 except Exception as e:
-                    print(f"Error decoding folder name: {e}")
+                    logger.warning(f"Error decoding folder name: {e}")
                     continue
-            return folder_list
+            self._folders = folder_list
+            self._folder_set = frozenset(folder_list)
+            return list(folder_list)
         except Exception as e:
-            print(f"Error listing folders: {e}")
+            logger.error(f"Error listing folders: {e}")
             return []
     
+    def has_folder(self, folder_name):
+        """Check whether folder_name is one of the folders list_folders() returns"""
+        if self._folders is None:
+            self.list_folders()
+        return folder_name in self._folder_set
+    
+    @staticmethod
+    def _message_set(message_ids):
+        """
+        Build a compact IMAP sequence set such as "1:5,8,10:12" from message numbers
+        """
+        numbers = sorted(int(num) for num in message_ids)
+        ranges = []
+        start = prev = numbers[0]
+        for num in numbers[1:]:
+            if num != prev + 1:
+                ranges.append(f"{start}:{prev}" if start != prev else str(start))
+                start = num
+            prev = num
+        ranges.append(f"{start}:{prev}" if start != prev else str(start))
+        return ",".join(ranges)
+    
+    def _fetch_pipelined(self, requests, depth=PIPELINE_DEPTH, mail=None):
+        """
+        Run several FETCH commands with up to depth of them in flight at once
+        
+        No other command may be sent on this connection until the generator is
+        exhausted or closed.
+        
+        Args:
+            requests (list): (message_ids, parts) pairs, one FETCH command each
+            depth (int): Maximum number of commands awaiting their tagged reply
+            mail (IMAP4): Connection to use instead of self.mail; only self.mail is
+                reconnected (once) if the server drops it
+            
+        Yields:
+            tuple: (message_id, items) in request order, where items maps upper-cased
+            FETCH item names to their parsed values; items is None if the server
+            returned nothing for that message
+        """
+        own = mail is None
+        mail = mail or self.mail
+        if own:
+            # Held until the generator finishes, which also keeps the keep-alive away
+            self._lock.acquire()
+        pending = deque()
+        responses = {}
+        sent = 0
+        index = 0
+        reconnected = False
+        requests = list(requests)
+        try:
+            while index < len(requests):
+                message_ids, parts = requests[index]
+                try:
+                    while sent < len(requests) and len(pending) < depth:
+                        ids, items = requests[sent]
+                        pending.append(mail._command('FETCH', self._message_set(ids), items))
+                        sent += 1
+                    
+                    status, data = mail._command_complete('FETCH', pending.popleft())
+                    status, data = mail._untagged_response(status, data, 'FETCH')
+                except (imaplib.IMAP4.abort, OSError):
+                    if not own or reconnected or not self._reconnect():
+                        raise
+                    # Resend everything from the request that was interrupted
+                    reconnected = True
+                    mail = self.mail
+                    pending.clear()
+                    sent = index
+                    continue
+                except imaplib.IMAP4.error:
+                    # BAD, typically a message set longer than the server accepts: collect
+                    # the commands already sent, then resend the rest in smaller pieces
+                    if len(message_ids) <= 1:
+                        raise
+                    while pending:
+                        try:
+                            mail._command_complete('FETCH', pending.popleft())
+                        except imaplib.IMAP4.error:
+                            pass
+                    mail.untagged_responses.pop('FETCH', None)
+                    self._fetch_limit = limit = min(self._fetch_limit, len(message_ids) // 2)
+                    logger.debug(f"Server rejected a FETCH of {len(message_ids)} messages, retrying {limit} at a time")
+                    requests[index:] = [(ids[start:start + limit], items)
+                                        for ids, items in requests[index:]
+                                        for start in range(0, len(ids), limit)]
+                    sent = index
+                    continue
+                
+                if own:
+                    self._last_activity = time.monotonic()
+                if status == 'OK':
+                    # Untagged replies carry no tag, so they are matched up by message number;
+                    # unsolicited flag updates may also arrive for the same message
+                    for number, items in _parse_fetch_response(data):
+                        responses.setdefault(number, {}).update(items)
+                
+                for message_num in message_ids:
+                    yield message_num, responses.pop(int(message_num), None)
+                index += 1
+        finally:
+            # If the caller stopped early, collect the replies still in flight so the
+            # next command does not pick them up
+            while pending:
+                try:
+                    mail._command_complete('FETCH', pending.popleft())
+                except Exception:
+                    pass
+            mail.untagged_responses.pop('FETCH', None)
+            if own:
+                self._lock.release()
+    
+    def _fetch_bulk(self, message_ids, parts='(RFC822)', batch=MAX_FETCH_BATCH):
+        """
+        Fetch messages with one FETCH command per batch instead of one per message
+        
+        Args:
+            message_ids (list): Message numbers as returned by SEARCH
+            parts (str): FETCH data items to request
+            batch (int): Number of messages per FETCH command (capped at MAX_FETCH_BATCH
+                or the lower limit the server has forced)
+            
+        Yields:
+            tuple: (message_id, items) as from _fetch_pipelined()
+        """
+        batch = max(1, min(batch, self._fetch_limit))
+        requests = [(message_ids[start:start + batch], parts)
+                    for start in range(0, len(message_ids), batch)]
+        return self._fetch_pipelined(requests)
+    
+    def _fetch_structures(self, message_ids, batch=MAX_FETCH_BATCH):
+        """
+        Fetch STRUCTURE_ITEMS for messages in the selected folder, reusing cached ones
+        
+        Args:
+            message_ids (list): Message numbers as returned by SEARCH
+            batch (int): Number of messages per FETCH command
+            
+        Returns:
+            list: (message_id, items) in message_ids order; items is None if the
+            server returned nothing for that message
+        """
+        cache = self._structure_cache
+        missing = [message_num for message_num in message_ids if message_num not in cache]
+        fetched = dict(self._fetch_bulk(missing, STRUCTURE_ITEMS, batch)) if missing else {}
+        if self._structure_state is not None:
+            cache.update((message_num, items) for message_num, items in fetched.items() if items)
+        return [(message_num, cache.get(message_num) or fetched.get(message_num)) for message_num in message_ids]
+    
+    def _decode_subject(self, email_message):
+        """Return the decoded subject of a message"""
+        subject = email_message["subject"]
+        if not subject:
+            return "No Subject"
+        try:
+            # A raw 8-bit subject comes back as an (unhashable) Header, which skips the cache
+            decoded_subject = _decode_header(subject) if isinstance(subject, str) else decode_header(subject)
+            return ''.join([self._safe_decode(text, charset=encoding) if isinstance(text, bytes) else str(text) 
+                            for text, encoding in decoded_subject])
+        except:
+            return self._safe_decode(subject)
+    
+    def _save_attachments(self, email_message, download_path, file_types, downloaded_files, claimed, writer, writes, index=None):
+        """
+        Save the matching attachments of one message
+        
+        Like the planned path, files are written by the writer threads and each write is
+        appended to writes as (future, name, file_path) for _finish_writes().
+        
+        Args:
+            claimed (set): _claim_key() forms of the file paths already present or taken in
+                this run; updated with the paths this message writes
+            writer (_AttachmentWriter): Writer threads to hand the attachments to
+            writes (list): Submitted writes awaiting _finish_writes()
+            index (_AttachmentIndex): Content index whose aliases count as existing files
+        
+        Returns:
+            int: Number of attachments saved or already present
+        """
+        email_attachments = 0
+        for part in email_message.walk():
+            if part.get_content_maintype() == 'multipart':
+                continue
+            if part.get('Content-Disposition') is None:
+                continue
+            
+            filename = part.get_filename()
+            if filename:
+                if _excluded_by_extension(filename, file_types):
+                    logger.debug(f"    Skipping {filename} (not in allowed types)")
+                    continue
+                
+                # Decode filename safely
+                filename = self._decode_filename(filename)
+                
+                # Check file type filter
+                if file_types and _extension(filename) not in file_types:
+                    logger.debug(f"    Skipping {filename} (not in allowed types)")
+                    continue
+                
+                # Create safe filename
+                safe_filename = self._create_safe_filename(filename)
+                file_path = os.path.join(download_path, safe_filename)
+                
+                # Check if file already exists, possibly as a duplicate of another name
+                existing = file_path if _claim_key(file_path) in claimed else index and index.alias_path(safe_filename)
+                if existing:
+                    logger.debug(f"    File already exists: {safe_filename}")
+                    downloaded_files.append(existing)
+                    email_attachments += 1
+                    continue
+                
+                # Save attachment
+                claimed.add(_claim_key(file_path))
+                try:
+                    payload = part.get_payload()
+                    encoding = str(part.get('Content-Transfer-Encoding', '')).strip().lower()
+                    if isinstance(payload, str) and encoding in ('base64', 'quoted-printable'):
+                        # Same str-to-bytes conversion get_payload(decode=True) uses
+                        try:
+                            payload = payload.encode('ascii', 'surrogateescape')
+                        except UnicodeError:
+                            payload = payload.encode('raw-unicode-escape')
+                    else:
+                        payload, encoding = part.get_payload(decode=True), None
+                    writes.append((writer.submit(file_path, payload, encoding), safe_filename, file_path))
+                    
+                    downloaded_files.append(file_path)
+                    email_attachments += 1
+                    logger.debug(f"    ✓ Downloaded: {safe_filename}")
+                except Exception as e:
+                    logger.warning(f"    ✗ Error saving {safe_filename}: {e}")
+                    continue
+        return email_attachments
+    
+    def _plan_attachments(self, structure, download_path, file_types, claimed, index=None):
+        """
+        Decide what to do with each attachment listed in a message's BODYSTRUCTURE
+        
+        Args:
+            structure (list): Parsed BODYSTRUCTURE of the message
+            download_path (str): Path to save attachments
+            file_types (frozenset): Extensions from _extension_filter(), or None for all
+            claimed (set): _claim_key() forms of the file paths already present in
+                download_path or taken by earlier attachments in this run; updated with
+                the paths this message will write
+            index (_AttachmentIndex): Content index whose aliases count as existing files
+            
+        Returns:
+            list: (action, name, file_path, section, encoding, size) tuples where action
+            is 'skip' (filtered out), 'exists' (already downloaded) or 'fetch'
+        """
+        plan = []
+        for section, filename, encoding, size in _walk_bodystructure(structure):
+            if _excluded_by_extension(filename, file_types):
+                plan.append(('skip', filename, None, section, encoding, size))
+                continue
+            
+            # Decode filename safely
+            filename = self._decode_filename(filename)
+            
+            # Check file type filter
+            if file_types and _extension(filename) not in file_types:
+                plan.append(('skip', filename, None, section, encoding, size))
+                continue
+            
+            # Create safe filename
+            safe_filename = self._create_safe_filename(filename)
+            file_path = os.path.join(download_path, safe_filename)
+            
+            # Check if file already exists (or is about to, from an earlier message)
+            if _claim_key(file_path) in claimed:
+                plan.append(('exists', safe_filename, file_path, section, encoding, size))
+                continue
+            
+            # A name saved before as a duplicate of another file needs no download either
+            alias = index and index.alias_path(safe_filename)
+            if alias:
+                plan.append(('exists', safe_filename, alias, section, encoding, size))
+                continue
+            
+            claimed.add(_claim_key(file_path))
+            plan.append(('fetch', safe_filename, file_path, section, encoding, size))
+        return plan
+    
+    def _fetch_sections(self, wanted, batch=MAX_FETCH_BATCH, mail=None, on_section=None, large=None):
+        """
+        Fetch individual body sections, pipelining one FETCH per group of messages wanting the same sections
+        
+        Args:
+            wanted (dict): Maps message numbers to the list of sections needed from each
+            batch (int): Number of messages per FETCH command
+            mail (IMAP4): Connection to use instead of self.mail
+            on_section (callable): Called on the fetching thread with (message_num, section,
+                data) as each FETCH completes, instead of collecting the data
+            large (dict): Maps (message_num, section) to the size of sections fetched in
+                pieces after the others; on_section gets a generator of the pieces as data
+                and must use it up (or close it) before returning
+        
+        Returns:
+            dict: Maps (message_num, section) to the raw, still-encoded section bytes;
+            empty when on_section is given
+        """
+        groups = {}
+        for message_num, sections in wanted.items():
+            groups.setdefault(tuple(sections), []).append(message_num)
+        
+        batch = max(1, min(batch, self._fetch_limit))
+        requests = []
+        for sections, message_ids in groups.items():
+            parts = '(' + ' '.join(f'BODY.PEEK[{section}]' for section in sections) + ')'
+            requests.extend((message_ids[start:start + batch], parts)
+                            for start in range(0, len(message_ids), batch))
+        
+        payloads = {}
+        for message_num, items in self._fetch_pipelined(requests, mail=mail):
+            for key, data in (items or {}).items():
+                if key.startswith('BODY[') and key.endswith(']') and data is not None:
+                    if on_section:
+                        on_section(message_num, key[5:-1], data)
+                    else:
+                        payloads[message_num, key[5:-1]] = data
+        
+        for (message_num, section), size in (large or {}).items():
+            chunks = self._fetch_section_chunks(message_num, section, size, mail)
+            if on_section:
+                on_section(message_num, section, chunks)
+            else:
+                payloads[message_num, section] = b''.join(chunks)
+        return payloads
+    
+    def _fetch_section_chunks(self, message_num, section, size, mail=None):
+        """
+        Yield one body section in PARTIAL_FETCH pieces, pipelining partial FETCHes (BODY.PEEK[n]<offset.length>)
+        
+        size is only an estimate (servers count line endings differently), so pieces
+        are requested until the server returns a short one.
+        
+        Raises:
+            ValueError: The server returned no data, or left a gap between pieces
+        """
+        offset = 0
+        full = True
+        while full:
+            count = max(1, -(-(size - offset) // PARTIAL_FETCH))
+            starts = range(offset, offset + count * PARTIAL_FETCH, PARTIAL_FETCH)
+            replies = self._fetch_pipelined([([message_num], f'(BODY.PEEK[{section}]<{start}.{PARTIAL_FETCH}>)')
+                                             for start in starts], mail=mail)
+            try:
+                for start, (_, items) in zip(starts, replies):
+                    # Each piece is named after its own offset, e.g. BODY[2]<1048576>
+                    data = (items or {}).get(f'BODY[{section}]<{start}>')
+                    if not data:
+                        full = False
+                        continue
+                    if start != offset:
+                        raise ValueError(f"server returned no data for bytes {offset}-{start - 1} of part {section}")
+                    offset += len(data)
+                    full = len(data) == PARTIAL_FETCH
+                    yield data
+            finally:
+                replies.close()
+        if not offset:
+            raise ValueError(f"server returned no data for part {section}")
+    
+    def _fetch_sections_parallel(self, wanted, batch, pool, on_section=None, large=None):
+        """
+        Split a _fetch_sections() call across this connection and the pooled ones
+        
+        Returns:
+            dict: Merged result of _fetch_sections() from every connection
+        """
+        connections = [self.mail] + pool
+        messages = list(wanted.items())
+        streams = list((large or {}).items())
+        shards = [(dict(messages[i::len(connections)]), dict(streams[i::len(connections)]), mail)
+                  for i, mail in enumerate(connections)]
+        shards = [shard for shard in shards if shard[0] or shard[1]]
+        if len(shards) <= 1:
+            return self._fetch_sections(wanted, batch, on_section=on_section, large=large)
+        
+        # Each worker owns one connection and returns its own dict, so nothing is shared;
+        # the lock keeps the keep-alive off self.mail while a worker is using it
+        payloads = {}
+        with self._lock, ThreadPoolExecutor(max_workers=len(shards)) as executor:
+            for result in executor.map(lambda shard: self._fetch_sections(shard[0], batch, shard[2], on_section, shard[1]), shards):
+                payloads.update(result)
+            self._last_activity = time.monotonic()
+        return payloads
+    
+    def _save_planned_attachments(self, message_num, plan, staged, downloaded_files, writes):
+        """
+        Print and carry out an attachment plan from _plan_attachments()
+        
+        The writes of fetched sections were started as the data arrived; each one is
+        taken from staged and appended to writes as (future, name, file_path) for
+        _finish_writes().
+        
+        Returns:
+            int: Number of attachments saved or already present
+        """
+        email_attachments = 0
+        for action, name, file_path, section, encoding, size in plan:
+            if action == 'skip':
+                logger.debug(f"    Skipping {name} (not in allowed types)")
+                continue
+            
+            if action == 'exists':
+                logger.debug(f"    File already exists: {name}")
+                downloaded_files.append(file_path)
+                email_attachments += 1
+                continue
+            
+            # Save attachment
+            try:
+                future = staged.pop((message_num, section), None)
+                if future is None:
+                    raise ValueError(f"server returned no data for part {section}")
+                writes.append((future, name, file_path))
+                
+                downloaded_files.append(file_path)
+                email_attachments += 1
+                logger.debug(f"    ✓ Downloaded: {name}")
+            except Exception as e:
+                logger.warning(f"    ✗ Error saving {name}: {e}")
+                continue
+        return email_attachments
+    
+    def _discard_staged(self, staged, targets):
+        """Wait for staged writes that no plan took up (after an error) and remove their files"""
+        for key, future in staged.items():
+            try:
+                future.result()
+            except Exception:
+                pass
+            _discard(targets[key][0] + '.part')
+        staged.clear()
+    
+    def _finish_writes(self, writes, downloaded_files, index):
+        """
+        Wait for submitted writes and move them into place in submission order
+        
+        Content identical to an earlier file is dropped and listed as that file;
+        failed writes are reported and removed from downloaded_files.
+        """
+        for future, name, file_path in writes:
+            staged_path = file_path + '.part'
+            try:
+                saved_path = index.store(staged_path, file_path, future.result())
+            except Exception as e:
+                _discard(staged_path)
+                logger.warning(f"    ✗ Error saving {name}: {e}")
+                downloaded_files.remove(file_path)
+                continue
+            if saved_path != file_path:
+                logger.debug(f"    Same content as {os.path.basename(saved_path)}, not saved again: {name}")
+                downloaded_files[downloaded_files.index(file_path)] = saved_path
+        writes.clear()
+    
+    def _download_messages(self, folder_name, message_list, download_path, file_types, batch_size):
+        """
+        Download matching attachments from a list of messages
+        
+        The BODYSTRUCTURE and subject of every message are fetched first; each batch
+        then fetches just the body sections holding wanted attachments. Messages
+        whose structure can't be used are fetched whole. Section downloads are spread
+        over up to max_connections connections.
+        
+        Args:
+            folder_name (str): Name of the selected folder, for the extra connections
+            message_list (list): Message numbers in processing order
+            download_path (str): Path to save attachments
+            file_types (list): List of file extensions to download
+            batch_size (int): Number of emails to process in each batch
+        """
+        file_types = _extension_filter(file_types)
+        downloaded_files = []
+        # One directory listing instead of a stat() per attachment
+        claimed = {_claim_key(os.path.join(download_path, name)) for name in os.listdir(download_path)}
+        total_emails = len(message_list)
+        total_batches = (total_emails - 1) // batch_size + 1
+        
+        # Structures are small, so fetch them all up front in one pipelined pass
+        try:
+            structures = self._fetch_structures(message_list, batch_size)
+        except Exception as e:
+            logger.error(f"  ✗ Error fetching email structure: {e}")
+            return downloaded_files
+        
+        # Extra connections are only opened once there is something to download
+        pool = None
+        # Writes from one batch may still be running while the next batch is fetched
+        writer = _AttachmentWriter()
+        writes = []
+        index = _AttachmentIndex(download_path)
+        try:
+            # Process emails in batches
+            for batch_start in range(0, total_emails, batch_size):
+                batch_end = min(batch_start + batch_size, total_emails)
+                
+                logger.info(f"\n--- Processing batch {batch_start//batch_size + 1}/{total_batches} (emails {batch_start+1}-{batch_end} of {total_emails}) ---")
+                
+                staged = {}
+                targets = {}
+                try:
+                    fetched = structures[batch_start:batch_end]
+                    
+                    # Work out which sections are needed before downloading any of them
+                    plans = {}
+                    for message_num, items in fetched:
+                        structure = (items or {}).get('BODYSTRUCTURE')
+                        if isinstance(structure, list):
+                            try:
+                                plans[message_num] = self._plan_attachments(structure, download_path, file_types, claimed, index)
+                            except Exception:
+                                pass
+                    
+                    # (message_num, section) -> (file_path, encoding, size) of each attachment to fetch
+                    targets = {(message_num, section): (file_path, encoding, size)
+                               for message_num, plan in plans.items()
+                               for action, name, file_path, section, encoding, size in plan if action == 'fetch'}
+                    # Large sections are fetched in pieces, the rest grouped by message
+                    large = {}
+                    wanted = {}
+                    for (message_num, section), (file_path, encoding, size) in targets.items():
+                        if size > LARGE_SECTION:
+                            large[message_num, section] = size
+                        else:
+                            wanted.setdefault(message_num, []).append(section)
+                    if wanted and pool is None:
+                        pool = self._open_pool(folder_name)
+                    
+                    def stage(message_num, section, data):
+                        # Runs on the fetching threads: start decoding and writing right away
+                        file_path, encoding, size = targets[message_num, section]
+                        if isinstance(data, bytes):
+                            staged[message_num, section] = writer.submit(file_path, data, encoding)
+                        else:
+                            # A large section: its pieces go to a writer thread as they arrive
+                            staged[message_num, section] = writer.stream(file_path, data, encoding)
+                    
+                    try:
+                        self._fetch_sections_parallel(wanted, batch_size, pool or [], stage, large)
+                    except (imaplib.IMAP4.abort, OSError) as e:
+                        # A dropped pooled connection (self.mail reconnects by itself): replace
+                        # the pool and fetch the sections that did not arrive, once
+                        logger.warning(f"  Connection lost during download ({e}), reconnecting...")
+                        self._close_pool(pool or [])
+                        self._imap('noop')
+                        pool = self._open_pool(folder_name)
+                        missing = {}
+                        for key in sorted(targets.keys() - staged.keys() - large.keys()):
+                            missing.setdefault(key[0], []).append(key[1])
+                        self._fetch_sections_parallel(missing, batch_size, pool, stage,
+                                                      {key: large[key] for key in sorted(large.keys() - staged.keys())})
+                    
+                    # Messages whose structure can't be used are fetched whole, the batch's together
+                    # (BODY.PEEK[] is the same bytes as RFC822 but leaves the message unread)
+                    whole = [message_num for message_num, items in fetched
+                             if items is not None and message_num not in plans]
+                    bodies = {}
+                    if whole:
+                        try:
+                            bodies = {message_num: items.get('BODY[]')
+                                      for message_num, items in self._fetch_bulk(whole, '(BODY.PEEK[])', batch_size) if items}
+                        except Exception as e:
+                            logger.warning(f"  ✗ Error fetching whole emails: {e}")
+                    
+                    # The previous batch's files have had this fetch to finish writing
+                    self._finish_writes(writes, downloaded_files, index)
+                    
+                    for i, (message_num, items) in enumerate(fetched, batch_start + 1):
+                        logger.debug(f"Processing email {i}/{total_emails} (Message ID: {message_num.decode()})")
+                        
+                        if items is None:
+                            logger.warning(f"  ✗ Failed to fetch email {message_num.decode()}")
+                            continue
+                        
+                        try:
+                            if message_num in plans:
+                                # Only the fetched Subject header, so skip MIME body parsing entirely
+                                header = next((value for key, value in items.items() if key.startswith('BODY[HEADER')), None)
+                                subject = self._decode_subject(_HEADER_PARSER.parsebytes(header if isinstance(header, bytes) else b''))
+                                logger.debug(f"  Subject: {subject[:50]}...")
+                                
+                                # Process attachments
+                                email_attachments = self._save_planned_attachments(message_num, plans[message_num], staged, downloaded_files, writes)
+                            else:
+                                # Fall back to parsing the whole message
+                                email_body = bodies.pop(message_num, None)
+                                if email_body is None:
+                                    logger.warning(f"  ✗ Failed to fetch email {message_num.decode()}")
+                                    continue
+                                
+                                email_message = email.message_from_bytes(email_body)
+                                
+                                subject = self._decode_subject(email_message)
+                                logger.debug(f"  Subject: {subject[:50]}...")
+                                
+                                # Process attachments
+                                email_attachments = self._save_attachments(email_message, download_path, file_types, downloaded_files, claimed, writer, writes, index)
+                            
+                            if email_attachments > 0:
+                                logger.debug(f"  ✓ Downloaded {email_attachments} attachment(s) from this email")
+                            else:
+                                logger.debug(f"  - No matching attachments in this email")
+                        
+                        except Exception as e:
+                            logger.warning(f"  ✗ Error processing email {message_num.decode()}: {e}")
+                            continue
+                except Exception as e:
+                    logger.error(f"  ✗ Error fetching batch: {e}")
+                self._discard_staged(staged, targets)
+                
+                logger.info(f"--- Completed batch {batch_start//batch_size + 1} ---")
+            
+            self._finish_writes(writes, downloaded_files, index)
+        finally:
+            writer.shutdown()
+            self._close_pool(pool or [])
+            try:
+                index.save()
+            except OSError as e:
+                logger.warning(f"Could not save attachment index: {e}")
+        
+        return downloaded_files
+    
     def download_attachments_from_folder(self, folder_name, download_path="./files", file_types=None, batch_size=100):
         """
         Download all attachments from a specific folder
@@ -137,143 +1503,50 @@ class EmailAttachmentDownloader:
             batch_size (int): Number of emails to process in each batch
         """
         if not self.mail:
-            print("Not connected to email server")
+            logger.error("Not connected to email server")
             return
         
         # Create download directory if it doesn't exist
-        if not os.path.exists(download_path):
-            os.makedirs(download_path)
-            print(f"Created directory: {download_path}")
+        _make_download_dir(download_path)
         
         try:
             # Select the folder
-            status, messages = self.mail.select(folder_name)
+            status, messages = self._imap('select', folder_name)
             if status != 'OK':
-                print(f"Failed to select folder: {folder_name}")
+                logger.error(f"Failed to select folder: {folder_name}")
                 return
             
             # Get total number of emails in the folder
-            status, message_numbers = self.mail.search(None, 'ALL')
+            status, message_numbers = self._search_attachments('ALL', file_types)
             if status != 'OK':
-                print("Failed to search emails")
+                logger.error("Failed to search emails")
                 return
             
             message_list = message_numbers[0].split()
             total_emails = len(message_list)
-            downloaded_files = []
             
-            print(f"Found {total_emails} emails in folder '{folder_name}'")
-            print(f"Processing in batches of {batch_size} emails...")
+            logger.info(f"Found {total_emails} emails in folder '{folder_name}'")
+            logger.info(f"Processing in batches of {batch_size} emails...")
             
-            # Process emails in reverse order (oldest first) to ensure we get all emails
-            # Convert to list and reverse to process from oldest to newest
-            message_list = list(message_list)
+            # SEARCH returns ascending message numbers; process the newest emails first
             message_list.reverse()
             
-            # Process emails in batches
-            for batch_start in range(0, len(message_list), batch_size):
-                batch_end = min(batch_start + batch_size, len(message_list))
-                batch_messages = message_list[batch_start:batch_end]
-                
-                print(f"\n--- Processing batch {batch_start//batch_size + 1}/{(len(message_list)-1)//batch_size + 1} (emails {batch_start+1}-{batch_end}) ---")
-                
-                for i, message_num in enumerate(batch_messages, batch_start + 1):
-                    print(f"Processing email {i}/{total_emails} (Message ID: {message_num.decode()})")
-                    
-                    try:
-                        # Fetch the email
-                        status, msg_data = self.mail.fetch(message_num, '(RFC822)')
-                        if status != 'OK':
-                            print(f"  ✗ Failed to fetch email {message_num.decode()}")
-                            continue
-                        
-                        email_body = msg_data[0][1]
-                        email_message = email.message_from_bytes(email_body)
-                        
-                        # Get email subject safely
-                        subject = email_message["subject"]
-                        if subject:
-                            try:
-                                decoded_subject = decode_header(subject)
-                                subject = ''.join([self._safe_decode(text) if isinstance(text, bytes) else str(text) 
-                                                 for text, encoding in decoded_subject])
-                            except:
-                                subject = self._safe_decode(subject)
-                        else:
-                            subject = "No Subject"
-                        
-                        print(f"  Subject: {subject[:50]}...")
-                        
-                        # Process attachments
-                        email_attachments = 0
-                        for part in email_message.walk():
-                            if part.get_content_maintype() == 'multipart':
-                                continue
-                            if part.get('Content-Disposition') is None:
-                                continue
-                            
-                            filename = part.get_filename()
-                            if filename:
-                                # Decode filename safely
-                                filename = self._decode_filename(filename)
-                                
-                                # Check file type filter
-                                if file_types:
-                                    file_ext = os.path.splitext(filename)[1].lower()
-                                    if file_ext not in file_types:
-                                        print(f"    Skipping {filename} (not in allowed types)")
-                                        continue
-                                
-                                # Create safe filename
-                                safe_filename = self._create_safe_filename(filename)
-                                file_path = os.path.join(download_path, safe_filename)
-                                
-                                # Check if file already exists
-                                if os.path.exists(file_path):
-                                    print(f"    File already exists: {safe_filename}")
-                                    downloaded_files.append(file_path)
-                                    email_attachments += 1
-                                    continue
-                                
-                                # Save attachment
-                                try:
-                                    with open(file_path, 'wb') as f:
-                                        f.write(part.get_payload(decode=True))
-                                    
-                                    downloaded_files.append(file_path)
-                                    email_attachments += 1
-                                    print(f"    ✓ Downloaded: {safe_filename}")
-                                except Exception as e:
-                                    print(f"    ✗ Error saving {safe_filename}: {e}")
-                                    continue
-                        
-                        if email_attachments > 0:
-                            print(f"  ✓ Downloaded {email_attachments} attachment(s) from this email")
-                        else:
-                            print(f"  - No matching attachments in this email")
-                    
-                    except Exception as e:
-                        print(f"  ✗ Error processing email {message_num.decode()}: {e}")
-                        continue
-                
-                print(f"--- Completed batch {batch_start//batch_size + 1} ---")
+            downloaded_files = self._download_messages(folder_name, message_list, download_path, file_types, batch_size)
             
-            print(f"\nDownloaded {len(downloaded_files)} files to {download_path}")
+            logger.info(f"\nDownloaded {len(downloaded_files)} files to {download_path}")
             return downloaded_files
             
         except Exception as e:
-            print(f"Error downloading attachments: {e}")
+            logger.error(f"Error downloading attachments: {e}")
             return []
     
     def _create_safe_filename(self, filename):
         """Create a safe filename by removing invalid characters"""
         if not filename:
-            return "unnamed_file"
+            return self._UNNAMED_FILE
         
-        # Remove or replace invalid characters
-        invalid_chars = '<>:"/\\|?*'
-        for char in invalid_chars:
-            filename = filename.replace(char, '_')
+        # Replace invalid characters
+        filename = filename.translate(self._INVALID_TRANS)
         
         # Remove leading/trailing spaces and dots
         filename = filename.strip(' .')
@@ -285,7 +1558,7 @@ class EmailAttachmentDownloader:
         
         # Ensure filename is not empty
         if not filename:
-            filename = "unnamed_file"
+            filename = self._UNNAMED_FILE
         
         return filename
     
@@ -300,16 +1573,15 @@ class EmailAttachmentDownloader:
             str: Date in DD-MMM-YYYY format for IMAP
         """
         try:
-            from datetime import datetime
             # Parse YYYYMMDD format
             date_obj = datetime.strptime(date_str, '%Y%m%d')
             # Convert to DD-MMM-YYYY format
             return date_obj.strftime('%d-%b-%Y')
         except ValueError as e:
-            print(f"Error converting date {date_str}: {e}")
+            logger.error(f"Error converting date {date_str}: {e}")
             return date_str  # Return original if conversion fails
     
-    def download_attachments_by_date_range(self, folder_name, start_date, end_date, download_path="./files", file_types=None):
+    def download_attachments_by_date_range(self, folder_name, start_date, end_date, download_path="./files", file_types=None, batch_size=100):
         """
         Download attachments from emails within a specific date range
         
@@ -319,109 +1591,47 @@ class EmailAttachmentDownloader:
             end_date (str): End date in format 'YYYYMMDD'
             download_path (str): Path to save attachments
             file_types (list): List of file extensions to download
+            batch_size (int): Number of emails to process in each batch
         """
         if not self.mail:
-            print("Not connected to email server")
+            logger.error("Not connected to email server")
             return
         
         # Create download directory if it doesn't exist
-        if not os.path.exists(download_path):
-            os.makedirs(download_path)
+        _make_download_dir(download_path)
         
         try:
             # Select the folder
-            status, messages = self.mail.select(folder_name)
+            status, messages = self._imap('select', folder_name)
             if status != 'OK':
-                print(f"Failed to select folder: {folder_name}")
+                logger.error(f"Failed to select folder: {folder_name}")
                 return
             
             # Convert dates to IMAP format
             imap_start_date = self._convert_date_to_imap_format(start_date)
             imap_end_date = self._convert_date_to_imap_format(end_date)
             
-            print(f"Searching for emails from {imap_start_date} to {imap_end_date}")
+            logger.info(f"Searching for emails from {imap_start_date} to {imap_end_date}")
             
             # Search for emails within date range
             search_criteria = f'(SINCE "{imap_start_date}" BEFORE "{imap_end_date}")'
-            status, message_numbers = self.mail.search(None, search_criteria)
+            status, message_numbers = self._search_attachments(search_criteria, file_types)
             if status != 'OK':
-                print("Failed to search emails")
+                logger.error("Failed to search emails")
                 return
             
             message_list = message_numbers[0].split()
             total_emails = len(message_list)
-            downloaded_files = []
             
-            print(f"Found {total_emails} emails in folder '{folder_name}' between {start_date} and {end_date}")
+            logger.info(f"Found {total_emails} emails in folder '{folder_name}' between {start_date} and {end_date}")
             
-            for i, message_num in enumerate(message_list, 1):
-                print(f"Processing email {i}/{total_emails}")
-                
-                try:
-                    # Fetch the email
-                    status, msg_data = self.mail.fetch(message_num, '(RFC822)')
-                    if status != 'OK':
-                        continue
-                    
-                    email_body = msg_data[0][1]
-                    email_message = email.message_from_bytes(email_body)
-                    
-                    # Get email subject safely
-                    subject = email_message["subject"]
-                    if subject:
-                        try:
-                            decoded_subject = decode_header(subject)
-                            subject = ''.join([self._safe_decode(text) if isinstance(text, bytes) else str(text) 
-                                             for text, encoding in decoded_subject])
-                        except:
-                            subject = self._safe_decode(subject)
-                    else:
-                        subject = "No Subject"
-                    
-                    print(f"  Subject: {subject}")
-                    
-                    # Process attachments
-                    for part in email_message.walk():
-                        if part.get_content_maintype() == 'multipart':
-                            continue
-                        if part.get('Content-Disposition') is None:
-                            continue
-                        
-                        filename = part.get_filename()
-                        if filename:
-                            # Decode filename safely
-                            filename = self._decode_filename(filename)
-                            
-                            # Check file type filter
-                            if file_types:
-                                file_ext = os.path.splitext(filename)[1].lower()
-                                if file_ext not in file_types:
-                                    continue
-                            
-                            # Create safe filename
-                            safe_filename = self._create_safe_filename(filename)
-                            file_path = os.path.join(download_path, safe_filename)
-                            
-                            # Save attachment
-                            try:
-                                with open(file_path, 'wb') as f:
-                                    f.write(part.get_payload(decode=True))
-                                
-                                downloaded_files.append(file_path)
-                                print(f"    Downloaded: {safe_filename}")
-                            except Exception as e:
-                                print(f"    Error saving {safe_filename}: {e}")
-                                continue
-                
-                except Exception as e:
-                    print(f"  Error processing email {i}: {e}")
-                    continue
+            downloaded_files = self._download_messages(folder_name, message_list, download_path, file_types, batch_size)
             
-            print(f"\nDownloaded {len(downloaded_files)} files to {download_path}")
+            logger.info(f"\nDownloaded {len(downloaded_files)} files to {download_path}")
             return downloaded_files
             
         except Exception as e:
-            print(f"Error downloading attachments: {e}")
+            logger.error(f"Error downloading attachments: {e}")
             return []
 
     def count_emails_with_attachments(self, folder_name, file_types=None):
@@ -433,20 +1643,20 @@ class EmailAttachmentDownloader:
             file_types (list): List of file extensions to count
         """
         if not self.mail:
-            print("Not connected to email server")
+            logger.error("Not connected to email server")
             return 0
         
         try:
             # Select the folder
-            status, messages = self.mail.select(folder_name)
+            status, messages = self._imap('select', folder_name)
             if status != 'OK':
-                print(f"Failed to select folder: {folder_name}")
+                logger.error(f"Failed to select folder: {folder_name}")
                 return 0
             
             # Get total number of emails in the folder
-            status, message_numbers = self.mail.search(None, 'ALL')
+            status, message_numbers = self._imap('search', None, 'ALL')
             if status != 'OK':
-                print("Failed to search emails")
+                logger.error("Failed to search emails")
                 return 0
             
             message_list = message_numbers[0].split()
@@ -454,62 +1664,71 @@ class EmailAttachmentDownloader:
             emails_with_attachments = 0
             total_attachments = 0
             
-            print(f"Scanning {total_emails} emails for attachments...")
+            logger.info(f"Scanning {total_emails} emails for attachments...")
+            file_types = _extension_filter(file_types)
             
-            # Process emails in reverse order (oldest first)
-            message_list = list(message_list)
-            message_list.reverse()
-            
-            for i, message_num in enumerate(message_list, 1):
+            # BODYSTRUCTURE describes every part without transferring any message content;
+            # fetched along with the subject so a following download can reuse it
+            whole = []
+            for i, (message_num, items) in enumerate(self._fetch_structures(message_list), 1):
                 if i % 50 == 0:  # Progress update every 50 emails
-                    print(f"Scanned {i}/{total_emails} emails...")
+                    logger.info(f"Scanned {i}/{total_emails} emails...")
+                
+                if not items:
+                    continue
                 
                 try:
-                    # Fetch the email
-                    status, msg_data = self.mail.fetch(message_num, '(RFC822)')
-                    if status != 'OK':
+                    filenames = [filename for section, filename, encoding, size in _walk_bodystructure(items['BODYSTRUCTURE'])]
+                except Exception:
+                    # As when downloading, a message whose structure can't be used is fetched whole
+                    whole.append(message_num)
+                    continue
+                
+                attachments = self._count_matching(filenames, file_types)
+                if attachments:
+                    emails_with_attachments += 1
+                    total_attachments += attachments
+            
+            if whole:
+                logger.info(f"Fetching {len(whole)} emails whose structure could not be read...")
+                for message_num, items in self._fetch_bulk(whole, '(BODY.PEEK[])'):
+                    body = (items or {}).get('BODY[]')
+                    if not isinstance(body, bytes):
                         continue
                     
-                    email_body = msg_data[0][1]
-                    email_message = email.message_from_bytes(email_body)
-                    
-                    # Check for attachments
-                    email_has_attachments = False
-                    for part in email_message.walk():
-                        if part.get_content_maintype() == 'multipart':
-                            continue
-                        if part.get('Content-Disposition') is None:
-                            continue
-                        
-                        filename = part.get_filename()
-                        if filename:
-                            # Decode filename safely
-                            filename = self._decode_filename(filename)
-                            
-                            # Check file type filter
-                            if file_types:
-                                file_ext = os.path.splitext(filename)[1].lower()
-                                if file_ext in file_types:
-                                    email_has_attachments = True
-                                    total_attachments += 1
-                            else:
-                                email_has_attachments = True
-                                total_attachments += 1
-                    
-                    if email_has_attachments:
+                    # Same attachment rule as _save_attachments()
+                    filenames = [part.get_filename() for part in email.message_from_bytes(body).walk()
+                                 if part.get_content_maintype() != 'multipart' and part.get('Content-Disposition') is not None]
+                    attachments = self._count_matching([name for name in filenames if name], file_types)
+                    if attachments:
                         emails_with_attachments += 1
-                
-                except Exception as e:
-                    continue
+                        total_attachments += attachments
             
-            print(f"Found {emails_with_attachments} emails with attachments out of {total_emails} total emails")
-            print(f"Total attachments found: {total_attachments}")
+            logger.info(f"Found {emails_with_attachments} emails with attachments out of {total_emails} total emails")
+            logger.info(f"Total attachments found: {total_attachments}")
             return emails_with_attachments
             
         except Exception as e:
-            print(f"Error counting emails: {e}")
+            logger.error(f"Error counting emails: {e}")
             return 0
 
+    def _count_matching(self, filenames, file_types):
+        """Count the attachment filenames that pass the file type filter"""
+        matching = 0
+        for filename in filenames:
+            if _excluded_by_extension(filename, file_types):
+                continue
+            try:
+                # Decode filename safely
+                filename = self._decode_filename(filename)
+            except Exception:
+                continue
+            
+            # Check file type filter
+            if not file_types or _extension(filename) in file_types:
+                matching += 1
+        return matching
+    
     def download_attachments_with_range(self, folder_name, search_range, download_path="./files", file_types=None):
         """
         Download attachments with various search range options
@@ -521,7 +1740,7 @@ class EmailAttachmentDownloader:
             file_types (list): List of file extensions to download
         """
         if not self.mail:
-            print("Not connected to email server")
+            logger.error("Not connected to email server")
             return
         
         search_type = search_range.get("type", "all")
@@ -535,7 +1754,8 @@ class EmailAttachmentDownloader:
                 date_range.get("start_date"), 
                 date_range.get("end_date"), 
                 download_path, 
-                file_types
+                file_types, 
+                search_range.get("batch_size", 100)
             )
         elif search_type == "count_limit":
             return self.download_attachments_with_count_limit(
@@ -554,7 +1774,7 @@ class EmailAttachmentDownloader:
                 search_range.get("batch_size", 50)
             )
         else:
-            print(f"Unknown search type: {search_type}")
+            logger.error(f"Unknown search type: {search_type}")
             return []
     
     def download_attachments_with_count_limit(self, folder_name, count_limit, download_path="./files", file_types=None, batch_size=50):
@@ -569,136 +1789,57 @@ class EmailAttachmentDownloader:
             batch_size (int): Number of emails to process in each batch
         """
         if not self.mail:
-            print("Not connected to email server")
+            logger.error("Not connected to email server")
             return
         
         # Create download directory if it doesn't exist
-        if not os.path.exists(download_path):
-            os.makedirs(download_path)
-            print(f"Created directory: {download_path}")
+        _make_download_dir(download_path)
         
         try:
             # Select the folder
-            status, messages = self.mail.select(folder_name)
-            if status != 'OK':
-                print(f"Failed to select folder: {folder_name}")
-                return
-            
-            # Get total number of emails in the folder
-            status, message_numbers = self.mail.search(None, 'ALL')
+            status, messages = self._imap('select', folder_name)
             if status != 'OK':
-                print("Failed to search emails")
+                logger.error(f"Failed to select folder: {folder_name}")
                 return
             
-            message_list = message_numbers[0].split()
-            total_emails = len(message_list)
-            downloaded_files = []
-            
-            print(f"Found {total_emails} emails in folder '{folder_name}'")
-            print(f"Processing first {count_limit} emails in batches of {batch_size}...")
-            
-            # Process emails in reverse order (oldest first) to ensure we get all emails
-            # Convert to list and reverse to process from oldest to newest
-            message_list = list(message_list)
-            message_list.reverse()
+            # The newest count_limit emails are the highest message numbers, up to the
+            # EXISTS count SELECT returned; search only that range, and within it only
+            # messages that may hold attachments
+            exists = messages[-1] if messages else None
+            if exists and exists.isdigit():
+                total_emails = int(exists)
+                first = max(1, total_emails - count_limit + 1)
+                criteria = f'{first}:*' if total_emails and count_limit > 0 else None
+            else:
+                status, message_numbers = self._imap('search', None, 'ALL')
+                if status != 'OK':
+                    logger.error("Failed to search emails")
+                    return
+                
+                message_list = message_numbers[0].split()
+                total_emails = len(message_list)
+                criteria = self._message_set(message_list[-count_limit:]) if message_list and count_limit > 0 else None
             
-            # Limit to the specified count
-            message_list = message_list[:count_limit]
-            actual_count = len(message_list)
+            logger.info(f"Found {total_emails} emails in folder '{folder_name}'")
+            logger.info(f"Processing first {count_limit} emails in batches of {batch_size}...")
             
-            # Process emails in batches
-            for batch_start in range(0, len(message_list), batch_size):
-                batch_end = min(batch_start + batch_size, len(message_list))
-                batch_messages = message_list[batch_start:batch_end]
-                
-                print(f"\n--- Processing batch {batch_start//batch_size + 1}/{(len(message_list)-1)//batch_size + 1} (emails {batch_start+1}-{batch_end} of {actual_count}) ---")
+            message_list = []
+            if criteria:
+                status, message_numbers = self._search_attachments(criteria, file_types)
+                if status != 'OK':
+                    logger.error("Failed to search emails")
+                    return
                 
-                for i, message_num in enumerate(batch_messages, batch_start + 1):
-                    print(f"Processing email {i}/{actual_count} (Message ID: {message_num.decode()})")
-                    
-                    try:
-                        # Fetch the email
-                        status, msg_data = self.mail.fetch(message_num, '(RFC822)')
-                        if status != 'OK':
-                            print(f"  ✗ Failed to fetch email {message_num.decode()}")
-                            continue
-                        
-                        email_body = msg_data[0][1]
-                        email_message = email.message_from_bytes(email_body)
-                        
-                        # Get email subject safely
-                        subject = email_message["subject"]
-                        if subject:
-                            try:
-                                decoded_subject = decode_header(subject)
-                                subject = ''.join([self._safe_decode(text) if isinstance(text, bytes) else str(text) 
-                                                 for text, encoding in decoded_subject])
-                            except:
-                                subject = self._safe_decode(subject)
-                        else:
-                            subject = "No Subject"
-                        
-                        print(f"  Subject: {subject[:50]}...")
-                        
-                        # Process attachments
-                        email_attachments = 0
-                        for part in email_message.walk():
-                            if part.get_content_maintype() == 'multipart':
-                                continue
-                            if part.get('Content-Disposition') is None:
-                                continue
-                            
-                            filename = part.get_filename()
-                            if filename:
-                                # Decode filename safely
-                                filename = self._decode_filename(filename)
-                                
-                                # Check file type filter
-                                if file_types:
-                                    file_ext = os.path.splitext(filename)[1].lower()
-                                    if file_ext not in file_types:
-                                        print(f"    Skipping {filename} (not in allowed types)")
-                                        continue
-                                
-                                # Create safe filename
-                                safe_filename = self._create_safe_filename(filename)
-                                file_path = os.path.join(download_path, safe_filename)
-                                
-                                # Check if file already exists
-                                if os.path.exists(file_path):
-                                    print(f"    File already exists: {safe_filename}")
-                                    downloaded_files.append(file_path)
-                                    email_attachments += 1
-                                    continue
-                                
-                                # Save attachment
-                                try:
-                                    with open(file_path, 'wb') as f:
-                                        f.write(part.get_payload(decode=True))
-                                    
-                                    downloaded_files.append(file_path)
-                                    email_attachments += 1
-                                    print(f"    ✓ Downloaded: {safe_filename}")
-                                except Exception as e:
-                                    print(f"    ✗ Error saving {safe_filename}: {e}")
-                                    continue
-                        
-                        if email_attachments > 0:
-                            print(f"  ✓ Downloaded {email_attachments} attachment(s) from this email")
-                        else:
-                            print(f"  - No matching attachments in this email")
-                    
-                    except Exception as e:
-                        print(f"  ✗ Error processing email {message_num.decode()}: {e}")
-                        continue
-                
-                print(f"--- Completed batch {batch_start//batch_size + 1} ---")
+                # SEARCH returns ascending message numbers; process the newest first
+                message_list = message_numbers[0].split()[::-1]
             
-            print(f"\nDownloaded {len(downloaded_files)} files to {download_path}")
+            downloaded_files = self._download_messages(folder_name, message_list, download_path, file_types, batch_size)
+            
+            logger.info(f"\nDownloaded {len(downloaded_files)} files to {download_path}")
             return downloaded_files
             
         except Exception as e:
-            print(f"Error downloading attachments: {e}")
+            logger.error(f"Error downloading attachments: {e}")
             return []
     
     def download_attachments_recent_days(self, folder_name, days, download_path="./files", file_types=None, batch_size=50):
@@ -713,23 +1854,20 @@ class EmailAttachmentDownloader:
             batch_size (int): Number of emails to process in each batch
         """
         if not self.mail:
-            print("Not connected to email server")
+            logger.error("Not connected to email server")
             return
         
         # Create download directory if it doesn't exist
-        if not os.path.exists(download_path):
-            os.makedirs(download_path)
-            print(f"Created directory: {download_path}")
+        _make_download_dir(download_path)
         
         try:
             # Select the folder
-            status, messages = self.mail.select(folder_name)
+            status, messages = self._imap('select', folder_name)
             if status != 'OK':
-                print(f"Failed to select folder: {folder_name}")
+                logger.error(f"Failed to select folder: {folder_name}")
                 return
             
             # Calculate the date for N days ago
-            from datetime import datetime, timedelta
             end_date = datetime.now()
             start_date = end_date - timedelta(days=days)
             
@@ -737,126 +1875,40 @@ class EmailAttachmentDownloader:
             start_date_str = start_date.strftime("%d-%b-%Y")
             end_date_str = end_date.strftime("%d-%b-%Y")
             
-            print(f"Searching for emails from {start_date_str} to {end_date_str} (last {days} days)")
+            logger.info(f"Searching for emails from {start_date_str} to {end_date_str} (last {days} days)")
             
-            # Search for emails within date range
-            search_criteria = f'(SINCE "{start_date_str}" BEFORE "{end_date_str}")'
-            status, message_numbers = self.mail.search(None, search_criteria)
+            # Search for emails within date range; no BEFORE, since nothing is newer than
+            # now and BEFORE today would leave out today's emails
+            search_criteria = f'SINCE "{start_date_str}"'
+            status, message_numbers = self._search_attachments(search_criteria, file_types)
             if status != 'OK':
-                print("Failed to search emails")
+                logger.error("Failed to search emails")
                 return
             
             message_list = message_numbers[0].split()
             total_emails = len(message_list)
-            downloaded_files = []
             
-            print(f"Found {total_emails} emails in the last {days} days")
+            logger.info(f"Found {total_emails} emails in the last {days} days")
             
             if total_emails == 0:
-                print("No emails found in the specified date range")
+                logger.info("No emails found in the specified date range")
                 return []
             
-            # Process emails in reverse order (oldest first)
-            message_list = list(message_list)
+            # SEARCH returns ascending message numbers; process the newest emails first
             message_list.reverse()
             
-            # Process emails in batches
-            for batch_start in range(0, len(message_list), batch_size):
-                batch_end = min(batch_start + batch_size, len(message_list))
-                batch_messages = message_list[batch_start:batch_end]
-                
-                print(f"\n--- Processing batch {batch_start//batch_size + 1}/{(len(message_list)-1)//batch_size + 1} (emails {batch_start+1}-{batch_end}) ---")
-                
-                for i, message_num in enumerate(batch_messages, batch_start + 1):
-                    print(f"Processing email {i}/{total_emails} (Message ID: {message_num.decode()})")
-                    
-                    try:
-                        # Fetch the email
-                        status, msg_data = self.mail.fetch(message_num, '(RFC822)')
-                        if status != 'OK':
-                            print(f"  ✗ Failed to fetch email {message_num.decode()}")
-                            continue
-                        
-                        email_body = msg_data[0][1]
-                        email_message = email.message_from_bytes(email_body)
-                        
-                        # Get email subject safely
-                        subject = email_message["subject"]
-                        if subject:
-                            try:
-                                decoded_subject = decode_header(subject)
-                                subject = ''.join([self._safe_decode(text) if isinstance(text, bytes) else str(text) 
-                                                 for text, encoding in decoded_subject])
-                            except:
-                                subject = self._safe_decode(subject)
-                        else:
-                            subject = "No Subject"
-                        
-                        print(f"  Subject: {subject[:50]}...")
-                        
-                        # Process attachments
-                        email_attachments = 0
-                        for part in email_message.walk():
-                            if part.get_content_maintype() == 'multipart':
-                                continue
-                            if part.get('Content-Disposition') is None:
-                                continue
-                            
-                            filename = part.get_filename()
-                            if filename:
-                                # Decode filename safely
-                                filename = self._decode_filename(filename)
-                                
-                                # Check file type filter
-                                if file_types:
-                                    file_ext = os.path.splitext(filename)[1].lower()
-                                    if file_ext not in file_types:
-                                        print(f"    Skipping {filename} (not in allowed types)")
-                                        continue
-                                
-                                # Create safe filename
-                                safe_filename = self._create_safe_filename(filename)
-                                file_path = os.path.join(download_path, safe_filename)
-                                
-                                # Check if file already exists
-                                if os.path.exists(file_path):
-                                    print(f"    File already exists: {safe_filename}")
-                                    downloaded_files.append(file_path)
-                                    email_attachments += 1
-                                    continue
-                                
-                                # Save attachment
-                                try:
-                                    with open(file_path, 'wb') as f:
-                                        f.write(part.get_payload(decode=True))
-                                    
-                                    downloaded_files.append(file_path)
-                                    email_attachments += 1
-                                    print(f"    ✓ Downloaded: {safe_filename}")
-                                except Exception as e:
-                                    print(f"    ✗ Error saving {safe_filename}: {e}")
-                                    continue
-                        
-                        if email_attachments > 0:
-                            print(f"  ✓ Downloaded {email_attachments} attachment(s) from this email")
-                        else:
-                            print(f"  - No matching attachments in this email")
-                    
-                    except Exception as e:
-                        print(f"  ✗ Error processing email {message_num.decode()}: {e}")
-                        continue
-                
-                print(f"--- Completed batch {batch_start//batch_size + 1} ---")
+            downloaded_files = self._download_messages(folder_name, message_list, download_path, file_types, batch_size)
             
-            print(f"\nDownloaded {len(downloaded_files)} files to {download_path}")
+            logger.info(f"\nDownloaded {len(downloaded_files)} files to {download_path}")
             return downloaded_files
             
         except Exception as e:
-            print(f"Error downloading attachments: {e}")
+            logger.error(f"Error downloading attachments: {e}")
             return []
 
 def main():
     """Example usage of the EmailAttachmentDownloader"""
+    configure_logging()
     
     # Configuration
     EMAIL_ADDRESS = "your_email@gmail.com"  # Replace with your email
@@ -6,32 +6,129 @@ This script downloads attachments from email and provides search configuration o
 
 import os
 import re
-from email_downloader import EmailAttachmentDownloader
+import json
+import time
+import contextlib
+import email_config
 from email_config import EMAIL_SETTINGS, DEFAULT_CONFIG
-from dotenv import load_dotenv
+from configure_search import (SETTINGS_BEGIN, SETTINGS_END, format_assignment, format_email_settings,
+                              _read_config, _remember_config, _write_config)
 
-def display_current_config():
-    """Display current search range configuration"""
-    print("=== Current Email Configuration ===")
+# Date format accepted for date_range searches: YYYYMMDD
+_DATE_RE = re.compile(r'\d{8}')
+
+# Value of the folder_name entry in email_config.py: a quoted string or a variable name
+_FOLDER_NAME_RE = re.compile(r'"folder_name":\s*("(?:[^"\\\n]|\\.)*"|\w+)')
+
+# Parts of email_config.py that save_configuration_robust writes unchanged
+_CONFIG_HEADER = '''import os
+# Email Configuration
+# Update these settings according to your email provider
+# max_connections: IMAP connections used in parallel for downloads; keep it below
+# the provider's per-account limit (Gmail allows 15), or set 1 for a single one
+'''
+
+_CREDENTIALS_LOADER = '''
+# Your email settings (update these)
+# Load email address, password and folder name from credentials.env
+def load_credentials(env_file='credentials.env'):
+    """Read account settings from the environment, falling back to env_file"""
+    # python-dotenv never overrides variables that are already set, so only
+    # import it when the file exists and could still supply something
+    names = ("email_address", "password", "folder_name")
+    if not all(os.getenv(name) for name in names) and os.path.exists(env_file):
+        from dotenv import load_dotenv
+        load_dotenv(env_file)
+    return os.getenv("email_address"), os.getenv("password"), os.getenv("folder_name") or "INBOX"
+
+# read account and password
+email_address, password, folder_name = load_credentials()
+'''
+
+# Provider configurations in email_config.py, with the comment above each
+_PROVIDERS = (
+    ("GMAIL_CONFIG", "Gmail Configuration"),
+    ("OUTLOOK_CONFIG", "Outlook/Hotmail Configuration"),
+    ("YAHOO_CONFIG", "Yahoo Configuration"),
+    ("QQ_CONFIG", "QQ Mail Configuration"),
+    ("MAIL163_CONFIG", "163 Mail Configuration"),
+    ("WANGYI_CONFIG", "Wangyi Corporate Mail Configuration"),
+)
+
+# Downloader shared by every menu action, so the connection is opened once per run
+_downloader = None
+
+# Seconds a passed access check stays valid, and (time.monotonic(), folder) of the last one
+ACCESS_CHECK_TTL = 60.0
+_access_checked = None
+
+def get_downloader():
+    """
+    Return the shared downloader, connected to the server
     
-    # Show folder
-    print(f"Target Folder: {EMAIL_SETTINGS['folder_name']}")
+    The connection is reused while it still answers a NOOP and reopened otherwise.
     
-    # Show search range settings
+    Returns:
+        EmailAttachmentDownloader: Connected downloader, or None if connecting failed
+    """
+    global _downloader
+    if _downloader is None:
+        # Imported on first use, so showing the menu or the configuration stays quick
+        from email_downloader import EmailAttachmentDownloader, configure_logging
+        configure_logging()
+        _downloader = EmailAttachmentDownloader(
+            email_address=EMAIL_SETTINGS["email_address"],
+            password=EMAIL_SETTINGS["password"],
+            imap_server=DEFAULT_CONFIG["imap_server"],
+            imap_port=DEFAULT_CONFIG["imap_port"],
+            max_connections=DEFAULT_CONFIG.get("max_connections", 4)
+        )
+    elif _downloader.mail:
+        try:
+            if _downloader.mail.noop()[0] == 'OK':
+                return _downloader
+        except Exception:
+            pass  # Dropped by the server; connect again below
+    
+    if not _downloader.connect():
+        return None
+    return _downloader
+
+def close_downloader():
+    """Log out the shared downloader, if it was ever connected"""
+    global _downloader
+    if _downloader is not None:
+        with contextlib.suppress(Exception):
+            _downloader.disconnect()
+        _downloader = None
+
+def _yes(prompt):
+    """Ask a yes/no question; any answer starting with y or Y counts as yes"""
+    return input(prompt).strip()[:1].lower() == 'y'
+
+def display_current_config():
+    """Display current search range configuration"""
+    # Collect the lines and print them at once
     search_range = EMAIL_SETTINGS["search_range"]
-    print(f"Search Range Enabled: {search_range['enabled']}")
-    print(f"Search Type: {search_range['type']}")
-    print(f"Batch Size: {search_range['batch_size']}")
+    lines = [
+        "=== Current Email Configuration ===",
+        # Show folder
+        f"Target Folder: {EMAIL_SETTINGS['folder_name']}",
+        # Show search range settings
+        f"Search Range Enabled: {search_range['enabled']}",
+        f"Search Type: {search_range['type']}",
+        f"Batch Size: {search_range['batch_size']}",
+    ]
     
     if search_range['type'] == 'date_range':
         date_range = search_range['date_range']
-        print(f"Date Range: {date_range['start_date']} to {date_range['end_date']}")
+        lines.append(f"Date Range: {date_range['start_date']} to {date_range['end_date']}")
     elif search_range['type'] == 'count_limit':
-        print(f"Count Limit: {search_range['count_limit']} emails")
+        lines.append(f"Count Limit: {search_range['count_limit']} emails")
     elif search_range['type'] == 'recent_days':
-        print(f"Recent Days: {search_range['recent_days']} days")
+        lines.append(f"Recent Days: {search_range['recent_days']} days")
     
-    print()
+    print("\n".join(lines) + "\n")
 
 def configure_search_range():
     """Interactive configuration of search range"""
@@ -44,17 +141,19 @@ def configure_search_range():
     print("5. Disable search range (use all emails)")
     
     choice = input("\nEnter your choice (1-5): ").strip()
+    search_range = EMAIL_SETTINGS["search_range"]
+    date_range = search_range["date_range"]
     
     if choice == "1":
         # All emails
-        EMAIL_SETTINGS["search_range"]["enabled"] = False
-        EMAIL_SETTINGS["search_range"]["type"] = "all"
+        search_range["enabled"] = False
+        search_range["type"] = "all"
         print("✓ Configured to download all emails")
         
     elif choice == "2":
         # Date range
-        EMAIL_SETTINGS["search_range"]["enabled"] = True
-        EMAIL_SETTINGS["search_range"]["type"] = "date_range"
+        search_range["enabled"] = True
+        search_range["type"] = "date_range"
         
         print("\nEnter date range (format: YYYYMMDD)")
         print("Example: 20240101, 20240315, 20241231")
@@ -64,60 +163,57 @@ def configure_search_range():
             end_date = input("End date: ").strip()
             
             # Basic validation for date format
-            date_pattern = r'^\d{8}$'
-            
-            if re.match(date_pattern, start_date) and re.match(date_pattern, end_date):
-                EMAIL_SETTINGS["search_range"]["date_range"]["start_date"] = start_date
-                EMAIL_SETTINGS["search_range"]["date_range"]["end_date"] = end_date
+            if _DATE_RE.fullmatch(start_date) and _DATE_RE.fullmatch(end_date):
+                date_range["start_date"] = start_date
+                date_range["end_date"] = end_date
                 print(f"✓ Configured date range: {start_date} to {end_date}")
                 break
             else:
                 print("❌ Invalid date format. Please use YYYYMMDD format (e.g., 20240101)")
-                retry = input("Try again? (y/n): ").lower().strip()
-                if retry != 'y':
+                if not _yes("Try again? (y/n): "):
                     print("Using default date range: 20240101 to 20241231")
-                    EMAIL_SETTINGS["search_range"]["date_range"]["start_date"] = "20240101"
-                    EMAIL_SETTINGS["search_range"]["date_range"]["end_date"] = "20241231"
+                    date_range["start_date"] = "20240101"
+                    date_range["end_date"] = "20241231"
                     break
         
     elif choice == "3":
         # Count limit
-        EMAIL_SETTINGS["search_range"]["enabled"] = True
-        EMAIL_SETTINGS["search_range"]["type"] = "count_limit"
+        search_range["enabled"] = True
+        search_range["type"] = "count_limit"
         
         try:
             count_limit = int(input("Enter maximum number of emails to process: ").strip())
-            EMAIL_SETTINGS["search_range"]["count_limit"] = count_limit
+            search_range["count_limit"] = count_limit
             print(f"✓ Configured to process maximum {count_limit} emails")
         except ValueError:
             print("Invalid number. Using default of 100 emails.")
-            EMAIL_SETTINGS["search_range"]["count_limit"] = 100
+            search_range["count_limit"] = 100
             
     elif choice == "4":
         # Recent days
-        EMAIL_SETTINGS["search_range"]["enabled"] = True
-        EMAIL_SETTINGS["search_range"]["type"] = "recent_days"
+        search_range["enabled"] = True
+        search_range["type"] = "recent_days"
         
         try:
             recent_days = int(input("Enter number of recent days to search: ").strip())
-            EMAIL_SETTINGS["search_range"]["recent_days"] = recent_days
+            search_range["recent_days"] = recent_days
             print(f"✓ Configured to search last {recent_days} days")
         except ValueError:
             print("Invalid number. Using default of 30 days.")
-            EMAIL_SETTINGS["search_range"]["recent_days"] = 30
+            search_range["recent_days"] = 30
             
     elif choice == "5":
         # Disable search range
-        EMAIL_SETTINGS["search_range"]["enabled"] = False
+        search_range["enabled"] = False
         print("✓ Disabled search range - will download all emails")
         
     else:
         print("Invalid choice. Using default (all emails).")
-        EMAIL_SETTINGS["search_range"]["enabled"] = False
-        EMAIL_SETTINGS["search_range"]["type"] = "all"
+        search_range["enabled"] = False
+        search_range["type"] = "all"
     
     # Configure batch size only for options that use it
-    if choice in ["1", "3", "4"] or EMAIL_SETTINGS["search_range"]["enabled"]:
+    if choice in ["1", "3", "4"] or search_range["enabled"]:
         print("\n" + "=" * 40)
         print("Batch Processing Configuration")
         print("=" * 40)
@@ -127,11 +223,11 @@ def configure_search_range():
         
         try:
             batch_size = int(input("Enter batch size for processing (default 50): ").strip() or "50")
-            EMAIL_SETTINGS["search_range"]["batch_size"] = batch_size
+            search_range["batch_size"] = batch_size
             print(f"✓ Batch size set to {batch_size}")
         except ValueError:
             print("Invalid batch size. Using default of 50.")
-            EMAIL_SETTINGS["search_range"]["batch_size"] = 50
+            search_range["batch_size"] = 50
     else:
         print("\n✓ Configuration complete!")
 
@@ -142,98 +238,30 @@ def save_configuration_robust():
     config_file = "email_config.py"
     
     try:
-        # Get current settings
-        search_range = EMAIL_SETTINGS["search_range"]
-        folder_name = EMAIL_SETTINGS["folder_name"]
-        
-        # Build the complete file content
-        file_content = f'''import os
-from dotenv import load_dotenv
-# Email Configuration
-# Update these settings according to your email provider
-
-# Gmail Configuration
-GMAIL_CONFIG = {{
-    "imap_server": "imap.gmail.com",
-    "imap_port": 993,
-    "smtp_server": "smtp.gmail.com",
-    "smtp_port": 587
-}}
-
-# Outlook/Hotmail Configuration
-OUTLOOK_CONFIG = {{
-    "imap_server": "outlook.office365.com",
-    "imap_port": 993,
-    "smtp_server": "smtp-mail.outlook.com",
-    "smtp_port": 587
-}}
-
-# Yahoo Configuration
-YAHOO_CONFIG = {{
-    "imap_server": "imap.mail.yahoo.com",
-    "imap_port": 993,
-    "smtp_server": "smtp.mail.yahoo.com",
-    "smtp_port": 587
-}}
-
-# QQ Mail Configuration
-QQ_CONFIG = {{
-    "imap_server": "imap.qq.com",
-    "imap_port": 993,
-    "smtp_server": "smtp.qq.com",
-    "smtp_port": 587
-}}
-
-# 163 Mail Configuration
-MAIL163_CONFIG = {{
-    "imap_server": "imap.163.com",
-    "imap_port": 993,
-    "smtp_server": "smtp.163.com",
-    "smtp_port": 587
-}}
-
-# Wangyi Corporate Mail Configuration
-WANGYI_CONFIG = {{
-    "imap_server": "imap.qiye.163.com",
-    "imap_port": 993,
-    "smtp_server": "smtp.qiye.163.com",
-    "smtp_port": 465
-}}
-
-# Default configuration (change this to your email provider)
-DEFAULT_CONFIG = WANGYI_CONFIG
-
-# Your email settings (update these)
-# Load email address, password and folder name from credentials.env
-# load env
-load_dotenv('credentials.env')
-# read account and password
-email_address = os.getenv("email_address")
-password = os.getenv("password")
-folder_name = os.getenv("folder_name") or "INBOX"
-
-EMAIL_SETTINGS = {{
-    "email_address": email_address,  # Replace with your email
-    "password": password,  # Will prompt for password if None
-    "folder_name": "{folder_name}",  # Email folder to search
-    "download_path": "./files",  # Path to save attachments
-    "file_types": ['.xls', '.xlsx'],  # File types to download
-    "search_range": {{
-        "enabled": {search_range["enabled"]},  # Set to True to use search range
-        "type": "{search_range["type"]}",  # Options: "all", "date_range", "count_limit", "recent_days"
-        "date_range": {{
-            "start_date": "{search_range["date_range"]["start_date"]}",  # Format: YYYYMMDD
-            "end_date": "{search_range["date_range"]["end_date"]}"     # Format: YYYYMMDD
-        }},
-        "count_limit": {search_range["count_limit"]},  # Maximum number of emails to process
-        "recent_days": {search_range["recent_days"]},   # Process emails from last N days
-        "batch_size": {search_range["batch_size"]}     # Number of emails to process in each batch
-    }}
-}}'''
+        # Write each provider block as currently configured (keeping edits such as
+        # max_connections) and keep the chosen provider as the default
+        chunks = [_CONFIG_HEADER]
+        default_provider = "WANGYI_CONFIG"
+        for name, comment in _PROVIDERS:
+            provider = getattr(email_config, name, None)
+            if provider is None:
+                continue
+            if provider is DEFAULT_CONFIG:
+                default_provider = name
+            chunks += ["\n# ", comment, "\n", format_assignment(name, provider), "\n"]
+        
+        chunks += ["\n# Default configuration (change this to your email provider)\n",
+                   f"DEFAULT_CONFIG = {default_provider}\n",
+                   _CREDENTIALS_LOADER,
+                   "\n", SETTINGS_BEGIN, "\n",
+                   # The chosen folder is written as a value, the account details
+                   # keep coming from credentials.env
+                   format_email_settings(EMAIL_SETTINGS, references=("email_address", "password")),
+                   "\n", SETTINGS_END, "\n"]
         
         # Write the complete file
         with open(config_file, 'w', encoding='utf-8') as f:
-            f.write(file_content)
+            f.writelines(chunks)
         
         print("✓ Configuration saved to email_config.py")
         return True
@@ -251,9 +279,7 @@ def configure_search_settings():
     display_current_config()
     
     # Ask if user wants to change configuration
-    change = input("Do you want to change the search range configuration? (y/n): ").lower().strip()
-    
-    if change == 'y':
+    if _yes("Do you want to change the search range configuration? (y/n): "):
         print("\n" + "=" * 50)
         configure_search_range()
         
@@ -263,8 +289,7 @@ def configure_search_settings():
         display_current_config()
         
         # Ask if user wants to save
-        save = input("Do you want to save this configuration? (y/n): ").lower().strip()
-        if save == 'y':
+        if _yes("Do you want to save this configuration? (y/n): "):
             if not save_configuration_robust():
                 print("Please manually update email_config.py with the new settings.")
         else:
@@ -288,18 +313,9 @@ def configure_folder_selection():
         print("Please fix the email access issues first.")
         return False
     
-    # Create a temporary downloader to get available folders
-    email_address = EMAIL_SETTINGS["email_address"]
-    downloader = EmailAttachmentDownloader(
-        email_address=email_address,
-        password=EMAIL_SETTINGS["password"],
-        imap_server=DEFAULT_CONFIG["imap_server"],
-        imap_port=DEFAULT_CONFIG["imap_port"]
-    )
-    
-    # Connect to email
-    print(f"\nConnecting to {email_address} to get available folders...")
-    if not downloader.connect():
+    # Reuse the connection the access check just made
+    downloader = get_downloader()
+    if not downloader:
         print("Failed to connect to email server. Please check your credentials.")
         return False
     
@@ -313,9 +329,8 @@ def configure_folder_selection():
             return False
         
         # Display folders with numbers
-        for i, folder in enumerate(folders, 1):
-            marker = " ← Current" if folder == current_folder else ""
-            print(f"{i:2d}. {folder}{marker}")
+        print("\n".join(f"{i:2d}. {folder}{' ← Current' if folder == current_folder else ''}"
+                        for i, folder in enumerate(folders, 1)))
         
         # Let user choose
         print(f"\nChoose a folder (1-{len(folders)}) or enter folder name manually:")
@@ -334,10 +349,9 @@ def configure_folder_selection():
         except ValueError:
             # User entered a folder name manually
             selected_folder = choice
-            if selected_folder not in folders:
+            if not downloader.has_folder(selected_folder):
                 print(f"Warning: '{selected_folder}' not found in available folders.")
-                confirm = input("Use this folder anyway? (y/n): ").lower().strip()
-                if confirm != 'y':
+                if not _yes("Use this folder anyway? (y/n): "):
                     return False
         
         # Update the configuration
@@ -349,66 +363,43 @@ def configure_folder_selection():
     except Exception as e:
         print(f"Error getting folders: {e}")
         return False
-    finally:
-        downloader.disconnect()
 
 def save_folder_configuration():
     """Save the folder configuration to email_config.py"""
     print("\n=== Saving Folder Configuration ===")
     
-    # Read the current email_config.py file
     config_file = "email_config.py"
-    if not os.path.exists(config_file):
-        print("Error: email_config.py not found")
-        return False
-    
     try:
-        with open(config_file, 'r', encoding='utf-8') as f:
-            content = f.read()
+        # Read the current email_config.py file (cached if it has not changed)
+        content = _read_config(config_file)
         
-        # Update the folder_name in EMAIL_SETTINGS
+        # Only the folder changes, so rewrite just the folder_name value inside the
+        # EMAIL_SETTINGS section between the sentinel comments
         new_folder_name = EMAIL_SETTINGS["folder_name"]
+        start = content.find(SETTINGS_BEGIN)
+        end = content.find(SETTINGS_END, start) if start != -1 else -1
+        match = _FOLDER_NAME_RE.search(content, start, end) if end != -1 else None
         
-        # Create the new EMAIL_SETTINGS string with updated folder_name
-        search_range = EMAIL_SETTINGS["search_range"]
-        new_settings = f'''EMAIL_SETTINGS = {{
-    "email_address": email_address,  # Replace with your email
-    "password": password,  # Will prompt for password if None
-    "folder_name": "{new_folder_name}",  # Email folder to search
-    "download_path": "./files",  # Path to save attachments
-    "file_types": ['.xls', '.xlsx'],  # File types to download
-    "search_range": {{
-        "enabled": {search_range["enabled"]},  # Set to True to use search range
-        "type": "{search_range["type"]}",  # Options: "all", "date_range", "count_limit", "recent_days"
-        "date_range": {{
-            "start_date": "{search_range["date_range"]["start_date"]}",  # Format: YYYYMMDD
-            "end_date": "{search_range["date_range"]["end_date"]}"     # Format: YYYYMMDD
-        }},
-        "count_limit": {search_range["count_limit"]},  # Maximum number of emails to process
-        "recent_days": {search_range["recent_days"]},   # Process emails from last N days
-        "batch_size": {search_range["batch_size"]}     # Number of emails to process in each batch
-    }}
-}}'''
-        
-        # Find and replace the EMAIL_SETTINGS section
-        # Use a more precise pattern that matches from EMAIL_SETTINGS = { to the closing }
-        pattern = r'EMAIL_SETTINGS\s*=\s*\{[^}]*"search_range":\s*\{[^}]*\}[^}]*\}\s*\}'
-        new_content = re.sub(pattern, new_settings, content, flags=re.DOTALL)
-        
-        # If the pattern didn't match, try a simpler approach
-        if new_content == content:
+        # If the entry is missing, ask for a manual update instead
+        if not match:
             print("Warning: Could not find EMAIL_SETTINGS section to replace.")
             print("Please manually update the folder_name in email_config.py:")
             print(f"  folder_name: {new_folder_name}")
             return False
         
+        # JSON string escapes are valid Python ones
+        new_content = content[:match.start(1)] + json.dumps(new_folder_name, ensure_ascii=False) + content[match.end(1):]
+        
         # Write the updated content back to the file
-        with open(config_file, 'w', encoding='utf-8') as f:
-            f.write(new_content)
+        _write_config(config_file, new_content)
+        _remember_config(config_file, new_content)
         
         print("✓ Folder configuration saved to email_config.py")
         return True
         
+    except FileNotFoundError:
+        print("Error: email_config.py not found")
+        return False
     except Exception as e:
         print(f"Error saving configuration: {e}")
         return False
@@ -424,8 +415,7 @@ def configure_folder_settings():
     # Configure folder selection
     if configure_folder_selection():
         # Ask if user wants to save
-        save = input("\nDo you want to save this folder configuration? (y/n): ").lower().strip()
-        if save == 'y':
+        if _yes("\nDo you want to save this folder configuration? (y/n): "):
             if not save_configuration_robust():
                 print("Please manually update email_config.py with the new folder.")
         else:
@@ -435,10 +425,23 @@ def configure_folder_settings():
     
     print("\nFolder configuration complete!")
 
-def check_email_access():
-    """Check if email can be successfully accessed with current credentials"""
+def check_email_access(force=False):
+    """
+    Check if email can be successfully accessed with current credentials
+    
+    A check that passed less than ACCESS_CHECK_TTL seconds ago for the same folder is
+    not repeated while the connection still answers, unless force is set.
+    """
+    global _access_checked
     print("=== Email Access Check ===")
     
+    target_folder = EMAIL_SETTINGS["folder_name"]
+    if (not force and _access_checked and _access_checked[1] == target_folder
+            and time.monotonic() - _access_checked[0] < ACCESS_CHECK_TTL and get_downloader()):
+        print(f"✓ Email access already checked in the last {ACCESS_CHECK_TTL:.0f} seconds")
+        return True
+    _access_checked = None
+    
     # Get configuration
     email_address = EMAIL_SETTINGS["email_address"]
     password = EMAIL_SETTINGS["password"]
@@ -457,17 +460,10 @@ def check_email_access():
     print(f"Email: {email_address}")
     print(f"IMAP Server: {DEFAULT_CONFIG['imap_server']}:{DEFAULT_CONFIG['imap_port']}")
     
-    # Create downloader instance
-    downloader = EmailAttachmentDownloader(
-        email_address=email_address,
-        password=password,
-        imap_server=DEFAULT_CONFIG["imap_server"],
-        imap_port=DEFAULT_CONFIG["imap_port"]
-    )
-    
-    # Test connection
+    # Test connection (reusing the open one, if it still answers)
     print("\nTesting email connection...")
-    if not downloader.connect():
+    downloader = get_downloader()
+    if not downloader:
         print("❌ Failed to connect to email server.")
         print("Possible issues:")
         print("1. Incorrect email address or password")
@@ -491,14 +487,12 @@ def check_email_access():
         print(f"✓ Found {len(folders)} folders")
         
         # Check if target folder exists
-        target_folder = EMAIL_SETTINGS["folder_name"]
-        if target_folder in folders:
+        if downloader.has_folder(target_folder):
             print(f"✓ Target folder '{target_folder}' found")
         else:
             print(f"⚠️  Target folder '{target_folder}' not found in available folders")
             print("Available folders:")
-            for folder in folders[:10]:  # Show first 10 folders
-                print(f"  - {folder}")
+            print("\n".join(f"  - {folder}" for folder in folders[:10]))  # Show first 10 folders
             if len(folders) > 10:
                 print(f"  ... and {len(folders) - 10} more")
         
@@ -511,14 +505,18 @@ def check_email_access():
         
         print(f"✓ Successfully accessed folder '{target_folder}'")
         
-        # Get email count
-        status, message_numbers = downloader.mail.search(None, 'ALL')
-        if status != 'OK':
-            print("❌ Failed to search emails in folder")
-            return False
-        
-        message_list = message_numbers[0].split()
-        total_emails = len(message_list)
+        # Get email count: SELECT already reported it (EXISTS); only search if it did not
+        if messages and messages[-1] and messages[-1].isdigit():
+            total_emails = int(messages[-1])
+        else:
+            status, message_numbers = downloader.mail.search(None, 'ALL')
+            if status != 'OK':
+                print("❌ Failed to search emails in folder")
+                return False
+            
+            # Count the numbers without splitting the (possibly huge) reply into a list
+            data = message_numbers[0]
+            total_emails = data.count(b' ') + 1 if data else 0
         print(f"✓ Found {total_emails} emails in folder")
         
         if total_emails == 0:
@@ -526,13 +524,12 @@ def check_email_access():
         else:
             print("✓ Email access check completed successfully!")
         
+        _access_checked = (time.monotonic(), target_folder)
         return True
         
     except Exception as e:
         print(f"❌ Error during email access check: {e}")
         return False
-    finally:
-        downloader.disconnect()
 
 def download_attachments_from_email():
     """
@@ -546,23 +543,14 @@ def download_attachments_from_email():
         return False
     
     # Get configuration
-    email_address = EMAIL_SETTINGS["email_address"]
     folder_name = EMAIL_SETTINGS["folder_name"]
     download_path = EMAIL_SETTINGS["download_path"]
     file_types = EMAIL_SETTINGS["file_types"]
     search_range = EMAIL_SETTINGS["search_range"]
     
-    # Create downloader instance
-    downloader = EmailAttachmentDownloader(
-        email_address=email_address,
-        password=EMAIL_SETTINGS["password"],
-        imap_server=DEFAULT_CONFIG["imap_server"],
-        imap_port=DEFAULT_CONFIG["imap_port"]
-    )
-    
-    # Connect to email (we already verified this works in check_email_access)
-    print(f"\nConnecting to {email_address}...")
-    if not downloader.connect():
+    # Reuse the connection check_email_access just verified
+    downloader = get_downloader()
+    if not downloader:
         print("Failed to connect to email server. Please check your credentials.")
         return False
     
@@ -570,15 +558,13 @@ def download_attachments_from_email():
         # List available folders
         print("\nAvailable folders:")
         folders = downloader.list_folders()
-        for folder in folders:
-            print(f"  - {folder}")
+        print("\n".join(f"  - {folder}" for folder in folders))
         
         # Check if target folder exists
-        if folder_name not in folders:
+        if not downloader.has_folder(folder_name):
             print(f"\nWarning: Folder '{folder_name}' not found in available folders.")
             print("Available folders:", folders)
-            use_inbox = input("Use INBOX instead? (y/n): ").lower().strip()
-            if use_inbox == 'y':
+            if _yes("Use INBOX instead? (y/n): "):
                 folder_name = "INBOX"
             else:
                 return False
@@ -605,8 +591,8 @@ def download_attachments_from_email():
         
         if downloaded_files:
             print(f"\n✓ Successfully downloaded {len(downloaded_files)} files to {download_path}:")
-            for file_path in downloaded_files:
-                print(f"  - {os.path.basename(file_path)}")
+            basename = os.path.basename
+            print("\n".join(f"  - {basename(file_path)}" for file_path in downloaded_files))
             return True
         else:
             print("No files were downloaded.")
@@ -615,9 +601,6 @@ def download_attachments_from_email():
     except Exception as e:
         print(f"Error during download: {e}")
         return False
-    finally:
-        # Always disconnect
-        downloader.disconnect()
 
 def show_menu():
     """Show the main menu"""
@@ -660,8 +643,8 @@ def main():
             configure_folder_settings()
             
         elif choice == "4":
-            # Test email access
-            check_email_access()
+            # Test email access, even if it was checked moments ago
+            check_email_access(force=True)
             
         elif choice == "5":
             # Show current configuration
@@ -669,6 +652,7 @@ def main():
             
         elif choice == "6":
             # Exit
+            close_downloader()
             print("Goodbye!")
             break
             